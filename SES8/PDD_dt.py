@@ -3,11 +3,29 @@
 #### last update 01.03.2023
 #### Author: Franziska Temme
 ########################################################################################################################
+#### The model can be run from the command line (python PDD_dt.py --help, default settings below)
+#### or called from other scripts:
+####    from PDD_dt import run_pdd
+####    dsout = run_pdd('../SES7/data/ERA5_input_bell.nc', params=dict(DDFice=8.0))
+####    ACC, MELT, SMB = pdd(Temp, Prec, MASK)
+#### or on the glacier cells only (see domain.py):
+####    ACC, MELT, SMB = pdd_cells(dom.gather(Temp), dom.gather(Prec))
+########################################################################################################################
 
 #### import required packages
+import os
+import ast
+import argparse
 import numpy as np
 import xarray as xr
 
+from jitbackend import njit, prange, useNumba
+from domain import Domain, loadDomain
+from outwriter import OutputWriter
+from instrument import configure, run_stats, stage
+from forcing import Downscaling, LAPSE_T, LAPSE_RRR, RRR_MIN
+from checkpoint import writeCheckpoint, readCheckpoint, restartIndex, checkpointSteps
+
 #### set file directories
 infile = '../SES7/data/ERA5_input_bell.nc'   # input path
 outfile = './output/Bell_SMB_out.nc'               # output path
@@ -23,107 +41,386 @@ DDFsnow = 5.0            # melt factor for snow in mm/d/°C
 
 Temp_in_K = False        # Is the input temperature given in Kelvin or degrees Celsius?
 
-#### read in the input data
-ds = xr.open_dataset(infile)
-
-if Temp_in_K == False:
-    Temp = np.array(ds.T2 - 273.15)
-else:
-    Temp = np.array(ds.T2)
-Prec = np.array(ds.RRR)
-MASK = np.array(ds.MASK)
-HGT = ds.HGT
-lats = ds.lat
-lons = ds.lon
-time = ds.time
-
-Temp[:,MASK == 0.0] = np.nan   # cut temperature input to glacier
-
-
-#### create arrays that will be filled in the simulations
-SNOWD = (Temp.copy() * 0.0)**2                 # snow depth
-ACC = np.zeros(np.shape(Temp))+np.nan          # accumulation
-MELT = np.zeros(np.shape(Temp))+np.nan         # melt
+#### downscaling of ERA5 during the run (only with run_pdd(..., era5=...), see forcing.py)
+lapse_T = LAPSE_T        # temperature lapse rate (K/m)
+lapse_RRR = LAPSE_RRR    # precipitation gradient (mm/m)
+rrr_min = RRR_MIN        # ERA5 precipitation (mm) up to which no precipitation is assumed
 
-#### calculate accumulation from precipitation
-ACC[Temp <= S_thresh] = Prec[Temp <= S_thresh] # precipitation below a threshold temperature equals snowfall
-ACC[Temp > S_thresh] = 0.0                     # precipitation above a threshold temperature equals zero snowfall
+backend = 'numpy'        # 'numpy', 'numba' (compiled, parallel over the glacier cells) or 'auto' (numba if installed)
+dtype = 'f8'             # data type of the model fields: 'f8' or 'f4' (half the memory, single precision)
+checkpoint_days = None   # with a checkpoint file (run_pdd(..., checkpoint=...)): days between the checkpoints of the
+                         # snow depth, None: only at the end of the run
 
-#### prepare melt
-MELT[Temp <= M_thresh] = 0.0                   # no melt is possible where we fall below the temperature threshold
+#### output settings
+out_vars = ['ACC', 'MELT', 'SMB']   # variables written to the output file
+out_freq = 'native'      # time aggregation: 'native' (every time step), 'daily', 'monthly' or 'annual'
+out_mean = False         # True: glacier-wide means instead of grids
+out_dtype = 'f4'         # data type in the output file ('f4' or 'f8')
+out_zlib = True          # compress the output file
 
 
 ########################################################################################################################
-#### START SIMULATION
+#### MODEL KERNEL
 ########################################################################################################################
-print('STARTING SIMULATION')
-
-#### time loop start
-for tt in np.arange(0,len(Temp)-1):
-
-    ## create empty arrays
-    MELTSNOWpot = np.zeros(np.shape(MASK)) + np.nan          # potential snow melt
-    MELTSNOW = np.zeros(np.shape(MASK)) + np.nan             # snow melt
-    MELTICE = np.zeros(np.shape(MASK)) + np.nan              # ice melt
-    Tas = np.zeros(np.shape(MASK)) + np.nan                  # temperature that has been used to melt the snow
-
-    MELTSNOW[Temp[tt,:,:] <= M_thresh] = 0.0                 # no snow melt is possible where we fall below the temperature threshold
-    MELTSNOWpot[Temp[tt, :, :] <= M_thresh] = 0.0            # no snow melt is possible where we fall below the temperature threshold
-    MELTICE[Temp[tt, :, :] <= M_thresh] = 0.0                # no ice melt is possible where we fall below the temperature threshold
-
-    ## calculate potential snow melt (independent of if there is enough snow to be melted)
-    MELTSNOWpot[Temp[tt,:,:] > M_thresh] = (dt/24) * DDFsnow * Temp[tt,Temp[tt,:,:] > M_thresh]
-
-    ## If we have more snow than potential snow melt: MELTSNOW = MELTSNOWpot, MELTICE = 0
-    MELTSNOW[SNOWD[tt,:,:] >= MELTSNOWpot] = MELTSNOWpot[SNOWD[tt,:,:] >= MELTSNOWpot]
-    MELTICE[SNOWD[tt,:,:] >= MELTSNOWpot] = 0.0
-
-    ## If we have less snow than potential snow melt:
-    # 1) Melt all the snow: MELTSNOW = SNOWD
-    MELTSNOW[SNOWD[tt,:,:] < MELTSNOWpot] = SNOWD[tt,SNOWD[tt,:,:] < MELTSNOWpot]
-    # 2) Melt the underlying ice with the "left-over" Temperature (T - Tas)
-    Tas[SNOWD[tt,:,:] < MELTSNOWpot] = (24/dt) * SNOWD[tt,SNOWD[tt,:,:] < MELTSNOWpot]/DDFsnow  # get temperature that has been used to melt the snow: Tas
-    MELTICE[SNOWD[tt,:,:] < MELTSNOWpot] = (dt/24) * DDFice * (Temp[tt,SNOWD[tt,:,:] < MELTSNOWpot] - Tas[SNOWD[tt,:,:] < MELTSNOWpot])  # melt the ice with the leftover Temp
-
-    ## total melt
-    MELT[tt,:,:] = MELTSNOW + MELTICE
-
-    ## update snow depth
-    SNOWD[tt+1,:,:] = SNOWD[tt,:,:] + (ACC[tt,:,:] - MELT[tt,:,:])
-    SNOWD[tt+1, SNOWD[tt+1,:,:] < 0.0] = 0
-
-
-#### calculate SMB for whole period
-SMB = ACC - MELT
-
-#### set non-glacierized points to 0
-SMB[:,MASK == 0] = np.nan
-ACC[:,MASK == 0] = np.nan
-MELT[:,MASK == 0] = np.nan
+#### works on the glacier cells only: Temp, Prec with shape (time, ncells) (°C, mm)
+#### all arrays of the time loop are allocated once before the loop
+#### SNOWD0: snow depth at the first time step (ncells), default 0
+#### last: True if the last time step is the end of the run (it is not simulated); False for a part of a run
+#### output: ACC, MELT (time, ncells) (mm) and the snow depth after the last simulated time step (ncells)
+def pdd_kernel(Temp, Prec, dt=dt, M_thresh=M_thresh, S_thresh=S_thresh, DDFice=DDFice, DDFsnow=DDFsnow, SNOWD0=None,
+               last=True):
+
+    nt, nc = np.shape(Temp)
+    ftype = np.asarray(Temp).dtype                 # float64 or float32
+
+    #### calculate accumulation from precipitation
+    # precipitation below a threshold temperature equals snowfall, above it equals zero snowfall
+    ACC = np.where(Temp <= S_thresh, Prec, np.where(Temp > S_thresh, 0.0, np.nan)).astype(ftype, copy=False)
+
+    #### prepare melt
+    MELT = np.where(Temp <= M_thresh, 0.0, np.nan).astype(ftype)  # no melt is possible where we fall below the temperature threshold
+
+    #### snow depth of the current and the next time step
+    SNOWD = np.zeros(nc, dtype=ftype) if SNOWD0 is None else np.array(SNOWD0, dtype=ftype)
+    SNOWDnext = np.zeros(nc, dtype=ftype)
+
+    #### buffers (allocated once)
+    cold = np.zeros(nc, dtype=bool)                # no melt possible
+    warm = np.zeros(nc, dtype=bool)                # melt possible
+    enough = np.zeros(nc, dtype=bool)              # more snow than potential snow melt
+    little = np.zeros(nc, dtype=bool)              # less snow than potential snow melt
+    base = np.zeros(nc, dtype=ftype)               # 0 where no melt is possible (nan where temperature is missing)
+    MELTSNOWpot = np.zeros(nc, dtype=ftype)        # potential snow melt
+    MELTSNOW = np.zeros(nc, dtype=ftype)           # snow melt
+    MELTICE = np.zeros(nc, dtype=ftype)            # ice melt
+    tmp = np.zeros(nc, dtype=ftype)
+
+    fsnow = (dt/24) * DDFsnow
+    fice = (dt/24) * DDFice
+
+    #### time loop start
+    for tt in np.arange(0,nt-1 if last else nt):
+        T = Temp[tt]
+
+        np.less_equal(T, M_thresh, out=cold)
+        np.greater(T, M_thresh, out=warm)
+        base.fill(np.nan)
+        np.copyto(base, 0.0, where=cold)
+
+        ## calculate potential snow melt (independent of if there is enough snow to be melted)
+        np.copyto(MELTSNOWpot, base)
+        np.multiply(T, fsnow, out=tmp)
+        np.copyto(MELTSNOWpot, tmp, where=warm)
+
+        np.greater_equal(SNOWD, MELTSNOWpot, out=enough)
+        np.less(SNOWD, MELTSNOWpot, out=little)
+
+        ## If we have more snow than potential snow melt: MELTSNOW = MELTSNOWpot, MELTICE = 0
+        np.copyto(MELTSNOW, base)
+        np.copyto(MELTICE, base)
+        np.copyto(MELTSNOW, MELTSNOWpot, where=enough)
+        np.copyto(MELTICE, 0.0, where=enough)
+
+        ## If we have less snow than potential snow melt:
+        # 1) Melt all the snow: MELTSNOW = SNOWD
+        np.copyto(MELTSNOW, SNOWD, where=little)
+        # 2) Melt the underlying ice with the "left-over" Temperature (T - Tas), Tas = (24/dt) * SNOWD / DDFsnow
+        np.multiply(SNOWD, (24/dt), out=tmp)
+        np.divide(tmp, DDFsnow, out=tmp)
+        np.subtract(T, tmp, out=tmp)
+        np.multiply(tmp, fice, out=tmp)
+        np.copyto(MELTICE, tmp, where=little)
+
+        ## total melt
+        np.add(MELTSNOW, MELTICE, out=MELT[tt])
+
+        ## update snow depth
+        np.subtract(ACC[tt], MELT[tt], out=tmp)
+        np.add(SNOWD, tmp, out=SNOWDnext)
+        np.less(SNOWDnext, 0.0, out=enough)
+        np.copyto(SNOWDnext, 0.0, where=enough)
+        SNOWD, SNOWDnext = SNOWDnext, SNOWD
+
+    return ACC, MELT, SNOWD
+
+
+#### same as pdd_kernel, compiled with numba: the glacier cells are split into blocks that run in parallel,
+#### within a block the time loop runs over neighbouring cells (contiguous in memory)
+#### M_thresh, S_thresh, DDFice, DDFsnow: one value per cell (ncells)
+@njit(parallel=True, cache=True)
+def pdd_kernel_numba(Temp, Prec, dt, M_thresh, S_thresh, DDFice, DDFsnow, SNOWD0, last):
+
+    nt, nc = Temp.shape
+    ACC = np.empty((nt, nc), Temp.dtype)
+    MELT = np.empty((nt, nc), Temp.dtype)
+    SNOWD = SNOWD0.copy()
+
+    nblock = 256                                   # cells per block
+    for b in prange((nc + nblock - 1) // nblock):
+        j0 = b * nblock
+        j1 = min(nc, j0 + nblock)
+        for tt in range(nt):
+            for j in range(j0, j1):
+                T = Temp[tt, j]
+                sd = SNOWD[j]
+                fsnow = (dt/24) * DDFsnow[j]
+                fice = (dt/24) * DDFice[j]
+
+                ## accumulation
+                if T <= S_thresh[j]:
+                    acc = Prec[tt, j]
+                elif T > S_thresh[j]:
+                    acc = 0.0
+                else:
+                    acc = np.nan
+                ACC[tt, j] = acc
+
+                ## no melt is possible where we fall below the temperature threshold
+                if T <= M_thresh[j]:
+                    base = 0.0
+                else:
+                    base = np.nan
+
+                if last and tt == nt - 1:
+                    MELT[tt, j] = base
+                    continue
+
+                ## potential snow melt
+                if T > M_thresh[j]:
+                    pot = fsnow * T
+                else:
+                    pot = base
+
+                if sd >= pot:          # more snow than potential snow melt
+                    ms = pot
+                    mi = 0.0
+                elif sd < pot:         # less snow: melt all snow and ice with the left-over temperature
+                    ms = sd
+                    mi = fice * (T - sd * (24/dt) / DDFsnow[j])
+                else:
+                    ms = base
+                    mi = base
+
+                melt = ms + mi
+                MELT[tt, j] = melt
+
+                ## update snow depth
+                sd = sd + (acc - melt)
+                if sd < 0.0:
+                    sd = 0.0
+                SNOWD[j] = sd
+
+    return ACC, MELT, SNOWD
 
 
 ########################################################################################################################
-#### WRITE OUTPUT
+#### MODEL
 ########################################################################################################################
-print('WRITING TO FILE')
-
-dsout = xr.Dataset(
-    data_vars=dict(
-        HGT=(['lat', 'lon'], np.array(HGT), {'units': 'm'}),
-        MASK=(['lat', 'lon'], np.array(MASK)),
-        ACC=(["time", "lat", "lon"], np.array(ACC) / 1000, {'units': 'm w.e.'}),
-        MELT=(["time", "lat", "lon"], np.array(MELT) / 1000, {'units': 'm w.e.'}),
-        SMB=(["time", "lat", "lon"], np.array(SMB) / 1000, {'units': 'm w.e.'}),
-    ),
-    coords=dict(
-        time=(["time"], np.array(time)),
-        lat=(["lat"], np.array(lats)),
-        lon=(["lon"], np.array(lons)),
-    ),
-)
-
-dsout.to_netcdf(outfile)
-
+#### Temp (°C), Prec (mm): (time, ncells) on the glacier cells (see domain.py), float64 or float32
+#### M_thresh, S_thresh, DDFice, DDFsnow: scalars or one value per cell (ncells), e.g. for ensembles
+#### SNOWD0, last: snow depth at the first time step and end of the run (see pdd_kernel)
+#### output: ACC, MELT, SMB (time, ncells) in mm; with state=True also the snow depth after the last simulated step
+def pdd_cells(Temp, Prec, dt=dt, M_thresh=M_thresh, S_thresh=S_thresh, DDFice=DDFice, DDFsnow=DDFsnow,
+              backend=backend, SNOWD0=None, last=True, state=False):
+
+    Tg = np.ascontiguousarray(Temp)
+    Pg = np.ascontiguousarray(Prec, dtype=Tg.dtype)
+    SNOWD0 = np.zeros(Tg.shape[1], dtype=Tg.dtype) if SNOWD0 is None else np.array(SNOWD0, dtype=Tg.dtype)
+
+    if useNumba(backend):
+        M_thresh, S_thresh, DDFice, DDFsnow = [np.ascontiguousarray(np.broadcast_to(np.asarray(x, dtype=float), Tg.shape[1:]))
+                                               for x in (M_thresh, S_thresh, DDFice, DDFsnow)]
+        ACC, MELT, SNOWD = pdd_kernel_numba(Tg, Pg, float(dt), M_thresh, S_thresh, DDFice, DDFsnow, SNOWD0,
+                                            bool(last))
+    else:
+        ACC, MELT, SNOWD = pdd_kernel(Tg, Pg, dt, M_thresh, S_thresh, DDFice, DDFsnow, SNOWD0, last)
+
+    #### calculate SMB for whole period
+    SMB = ACC - MELT
+
+    if state:
+        return ACC, MELT, SMB, SNOWD
+    return ACC, MELT, SMB
+
+
+#### Temp (°C), Prec (mm): (time, lat, lon); MASK: glacier mask (lat, lon) or Domain
+#### the model runs on the glacier cells only, the results are put back on the grid (nan outside the glacier)
+#### output: ACC, MELT, SMB (time, lat, lon) in mm
+def pdd(Temp, Prec, MASK, dt=dt, M_thresh=M_thresh, S_thresh=S_thresh, DDFice=DDFice, DDFsnow=DDFsnow,
+        backend=backend):
+
+    dom = MASK if isinstance(MASK, Domain) else Domain(MASK)
+
+    ACC, MELT, SMB = pdd_cells(dom.gather(Temp), dom.gather(Prec), dt, M_thresh, S_thresh, DDFice, DDFsnow, backend)
+
+    return dom.scatter(ACC), dom.scatter(MELT), dom.scatter(SMB)
+
+
+#### parameters of run_pdd (defaults from the settings above)
+PARAMS = ['dt', 'M_thresh', 'S_thresh', 'DDFice', 'DDFsnow', 'Temp_in_K', 'backend', 'dtype', 'checkpoint_days',
+          'lapse_T', 'lapse_RRR', 'rrr_min', 'out_vars', 'out_freq', 'out_mean', 'out_dtype', 'out_zlib']
+
+
+#### forcing: input file or Dataset with T2, RRR (mm), HGT, MASK; domain: Domain, domain file or None (MASK of forcing)
+#### params: dictionary with the settings that differ from the defaults above (e.g. dict(DDFice=8.0))
+#### output: None: the output Dataset (HGT, MASK, ACC, MELT, SMB in m w.e.) is returned
+####         file name: the out_vars are written with the aggregation and encoding of the out_* settings,
+####         the file name is returned
+#### era5: ERA5 file or Dataset (t2m, tp, z): T2 and RRR are downscaled on the glacier cells with the lapse rates
+####       above (see forcing.py) instead of read from the forcing, which then only needs HGT, MASK and time
+#### checkpoint: file the snow depth is written to every checkpoint_days days and at the end of the run (see checkpoint.py)
+#### restart: checkpoint file of an earlier run: the run starts at the time step of the checkpoint with its snow depth,
+####          the forcing only has to cover the time from there on
+def run_pdd(forcing=infile, domain=None, params=None, output=None, verbose=True, era5=None, checkpoint=None,
+            restart=None):
+
+    unknown = [k for k in (params or {}) if k not in PARAMS]
+    if unknown:
+        raise ValueError('unknown PDD parameters: %s, use %s' % (unknown, PARAMS))
+    p = {k: globals()[k] for k in PARAMS}
+    p.update(params or {})
+    log = print if verbose else (lambda *args: None)
+
+    #### read in the input data (glacier cells only)
+    ds = forcing if isinstance(forcing, xr.Dataset) else xr.open_dataset(forcing)
+    if isinstance(domain, Domain):
+        dom = domain
+    elif domain is None:
+        dom = Domain(np.array(ds.MASK), np.array(ds.lat), np.array(ds.lon), p['dtype'])
+    else:
+        dom = loadDomain(domain, p['dtype'])
+
+    #### restart: snow depth of the checkpoint, the run starts at its time step
+    SNOWD = None
+    if restart is not None:
+        tstate, state = readCheckpoint(restart, 'pdd', dom)
+        ds = ds.isel(time=slice(restartIndex(np.array(ds.time), tstate), None))
+        SNOWD = state['SNOWD']
+        log('RESTART FROM %s AT %s' % (restart, str(tstate)[:16]))
+
+    nt = ds.sizes['time']
+    with run_stats('pdd', ncells=dom.ncells, nt=nt, backend=p['backend'], dtype=p['dtype']):
+        with stage('read', dom.ncells, nt):
+            if era5 is None:
+                Temp = dom.gather(ds.T2, 'f8')
+                Prec = dom.gather(ds.RRR)
+            else:
+                downscaling = Downscaling(era5, np.array(ds.HGT), np.array(ds.lat), np.array(ds.lon), dom,
+                                          np.array(ds.time), p['lapse_T'], p['lapse_RRR'], p['rrr_min'])
+                Temp = downscaling.temperature()
+                Prec = downscaling.precipitation().astype(dom.dtype, copy=False)
+            if p['Temp_in_K'] == False:
+                Temp = Temp - 273.15
+            Temp = Temp.astype(dom.dtype, copy=False)
+        MASK = np.array(ds.MASK)
+        HGT = ds.HGT
+        lats = ds.lat
+        lons = ds.lon
+        time = ds.time
+
+
+        ########################################################################################################################
+        #### START SIMULATION
+        ########################################################################################################################
+        log('STARTING SIMULATION (%d glacier cells of %d)' % (dom.ncells, MASK.size))
+
+        model = (p['dt'], p['M_thresh'], p['S_thresh'], p['DDFice'], p['DDFsnow'], p['backend'])
+        if checkpoint is None:
+            with stage('timeloop', dom.ncells, nt):
+                ACC, MELT, SMB = pdd_cells(Temp, Prec, *model, SNOWD0=SNOWD)
+        else:
+            #### the time loop runs from checkpoint to checkpoint, the snow depth is written after every part
+            st_p_day = int(24 / p['dt'])
+            every = None if p['checkpoint_days'] is None else int(p['checkpoint_days']) * st_p_day
+            tend = np.array(time)[-1] + np.timedelta64(int(p['dt'] * 3600), 's')
+            ACC, MELT, SMB = [np.empty_like(Temp) for i in range(3)]
+            marks = checkpointSteps(nt, every, st_p_day)
+            t0 = 0
+            for t in marks + ([nt] if nt not in marks else []):
+                sl = slice(t0, t)
+                with stage('timeloop', dom.ncells, t - t0):
+                    ACC[sl], MELT[sl], SMB[sl], SNOWD = pdd_cells(Temp[sl], Prec[sl], *model, SNOWD0=SNOWD,
+                                                                  last=(t == nt), state=True)
+                t0 = t
+                if t not in marks:
+                    break                                   # end of the run within a day: no checkpoint
+                if t == nt:
+                    ## end of the run: the last time step is simulated for the snow depth after it
+                    SNOWD = pdd_cells(Temp[-1:], Prec[-1:], *model, SNOWD0=SNOWD, last=False, state=True)[3]
+                log('CHECKPOINT %s' % str(np.array(time)[t] if t < nt else tend)[:16])
+                with stage('checkpoint', dom.ncells, 1):
+                    writeCheckpoint(checkpoint, 'pdd', np.array(time)[t] if t < nt else tend, dom, SNOWD=SNOWD)
+
+
+        ########################################################################################################################
+        #### OUTPUT
+        ########################################################################################################################
+
+        results = dict(ACC=ACC, MELT=MELT, SMB=SMB)
+        unknown = [name for name in p['out_vars'] if name not in results]
+        if unknown:
+            raise ValueError('unknown output variables %s, use %s' % (unknown, list(results)))
+
+        if output is not None:
+            log('WRITING TO FILE')
+            variables = {name: ({'units': 'm w.e.'}, 'sum') for name in p['out_vars']}
+            with stage('write', dom.ncells, nt), \
+                    OutputWriter(output, np.array(time), dom, variables, p['out_freq'], p['out_mean'],
+                                 static=dict(HGT=(np.array(HGT), {'units': 'm'}), MASK=(MASK, {})),
+                                 dtype=p['out_dtype'], zlib=p['out_zlib']) as writer:
+                writer.write(0, **{name: results[name] / 1000 for name in p['out_vars']})
+            return output
+
+        with stage('output', dom.ncells, nt):
+            dsout = xr.Dataset(
+                data_vars=dict(
+                    HGT=(['lat', 'lon'], np.array(HGT), {'units': 'm'}),
+                    MASK=(['lat', 'lon'], np.array(MASK)),
+                    **{name: (["time", "lat", "lon"], dom.scatter(results[name]) / 1000, {'units': 'm w.e.'})
+                       for name in p['out_vars']},
+                ),
+                coords=dict(
+                    time=(["time"], np.array(time)),
+                    lat=(["lat"], np.array(lats)),
+                    lon=(["lon"], np.array(lons)),
+                ),
+            )
+
+        return dsout
 
 
+########################################################################################################################
+#### COMMAND LINE
+########################################################################################################################
 
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Positive degree-day model')
+    parser.add_argument('--input', default=infile, help='input file (T2, RRR, HGT, MASK)')
+    parser.add_argument('--output', default=outfile, help='output file')
+    parser.add_argument('--domain', default=None, help='file with the glacier MASK (default: MASK of the input)')
+    parser.add_argument('--era5', default=None, help='ERA5 file (t2m, tp, z): T2 and RRR are downscaled during the run')
+    parser.add_argument('--set', nargs='*', default=[], metavar='NAME=VALUE',
+                        help='settings that differ from the defaults, e.g. --set DDFice=8.0 backend=numba')
+    parser.add_argument('--checkpoint', default=None, help='file for the snow depth of the run (every checkpoint_days and at the end)')
+    parser.add_argument('--restart', default=None, help='checkpoint file to continue a run from')
+    parser.add_argument('--stats', default=os.environ.get('SMB_STATS'),
+                        help="file for the run statistics of the stages (JSON lines, '-': standard error)")
+    parser.add_argument('--profile', default=os.environ.get('SMB_PROFILE'), help='file for a cProfile dump of the run')
+    args = parser.parse_args(argv)
+    configure(args.stats, args.profile)
+
+    params = {}
+    for item in args.set:
+        name, value = item.split('=', 1)
+        try:
+            params[name] = ast.literal_eval(value)   # numbers, True/False
+        except (ValueError, SyntaxError):
+            params[name] = value                     # strings (e.g. backend=numba)
+
+    run_pdd(args.input, args.domain, params, args.output, era5=args.era5, checkpoint=args.checkpoint,
+            restart=args.restart)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,40 +6,102 @@
 ## Last update: 05.04.2023
 ########################################################################################################################
 
+## Input of the mass balance model
+## Accessed by:
+##    SEB_main_SD.py
+##
+## Nothing is read at import: the functions below open the files when a run needs them.
+## The forcing (T2, G, RRR) is opened lazily and read in time chunks with read_forcing.
+## T2 and RRR can also be downscaled from ERA5 chunk by chunk (see ../forcing.py), then the input
+## file only needs G, HGT and MASK.
+
 
 ########################################################################################################################
-####  IMPORT EXTERNAL PACKAGES 
+####  IMPORT EXTERNAL PACKAGES
 
 ## Import general Python packages
 import numpy as np
 import pandas as pd
 import xarray as xr
 
-#### READ IN DATA   
+#### READ IN DATA
 ########################################################################################################################
 
-## Input - Output path
+## Input - Output path (defaults of the command line, see SEB_main_SD.py)
 INPUT_NAME = '../data/ERA5_G_input_bell.nc'
 OUTPUT_NAME = '../output/Bell_SMB_out_SEB.nc'
+DOMAIN_NAME = INPUT_NAME              # file with the glacier MASK (e.g. '../../SES6/dom/Bell_dom.nc', the input file has a copy)
+SVF_NAME = '../SVF/LUT_SVFdir45.nc'   # look-up table of directed sky-view factors (can be created with the script LUT_SVFdir45.py)
+WIND_NAME = '../data/wind_data.nc'    # timeseries of wind direction and speed (created with ../wind.py)
+
+
+#### input netcdf file (opened lazily; a Dataset is returned as it is)
+def open_forcing(forcing=INPUT_NAME):
+    if isinstance(forcing, xr.Dataset):
+        return forcing
+    return xr.open_dataset(forcing)
+
+
+#### forcing for the time steps sl: T2 (°C), G (W m**-2) and Prec (m), each (time, lat, lon)
+#### or (time, ncells) on the glacier cells of dom (see domain.py)
+#### downscaling: forcing.Downscaling (on the same cells) for T2 and RRR instead of the input file
+def read_forcing(ds, sl=slice(None), dom=None, downscaling=None):
+    if downscaling is None:
+        T2 = np.array(ds.T2[sl])-273.15       # air temperature (converted from K to °C)
+        Prec = np.array(ds.RRR[sl])/1000      # precipitation (converted from mm to m)
+    else:
+        T2 = downscaling.temperature(sl)-273.15
+        Prec = downscaling.precipitation(sl)/1000
+    G = np.array(ds.G[sl])                    # radiation (potential or global, adjust in SEB_param)
+    if dom is not None:
+        G = dom.gather(G)
+        if downscaling is None:
+            T2, Prec = dom.gather(T2), dom.gather(Prec)
+        else:
+            T2, Prec = T2.astype(dom.dtype, copy=False), Prec.astype(dom.dtype, copy=False)
+    return T2, G, Prec
+
 
-## read data
-ds = xr.open_dataset(INPUT_NAME)      # input netcdf file
-T2 = np.array(ds.T2)-273.15           # air temperature (converted from °C to K)
-G = np.array(ds.G)                    # radiation (potential or global, adjust in SEB_param)
-Prec = np.array(ds.RRR)/1000          # precipitation (converted from mm to m)
-MASK = np.array(ds.MASK)              # glacier mask
-lats = np.array(ds.lat)        
-lons = np.array(ds.lon)
-time = np.array(ds.time)
-HGT = ds.HGT                          # DEM
+#### look-up table of directed sky-view factors SVFdir (count, lat, lon)
+def load_svf(svf_lut=SVF_NAME):
+    if isinstance(svf_lut, xr.DataArray):
+        return svf_lut
+    if isinstance(svf_lut, xr.Dataset):
+        return svf_lut.SVFdir
+    with xr.open_dataset(svf_lut) as dsSVF:
+        return dsSVF.SVFdir.load()
 
-#### read in SVF
-dsSVF = xr.open_dataset('../SVF/LUT_SVFdir45.nc')    # path to the look-up table of directed sky-view factors
-LUT_SVF = dsSVF.SVFdir                # look-up table of directed sky-view factors (can be created with the script LUT_SVFdir45.py)
 
-#### read in Wind data
-Wind = pd.read_csv('../data/wind_data.csv', sep='\t')
+#### timeseries of wind direction DIR (°) and wind speed WS (m/s)
+#### from a file (NetCDF of ../wind.py, memory-mapped, or tab-separated csv), a Dataset or DataFrame
+#### (DIR, WS) or a tuple (DIR, WS)
+#### time: time axis of the forcing; wind with a time axis is taken at these time steps (ValueError if some
+#### are missing), wind without (tuple) is used from the first time step on
+def load_wind(wind=WIND_NAME, time=None):
+    if isinstance(wind, str) and wind.endswith('.nc'):
+        try:
+            wind = xr.open_dataset(wind, engine='scipy')      # NetCDF-3: memory-mapped
+        except (TypeError, ValueError):
+            wind = xr.open_dataset(wind)
+    elif isinstance(wind, str):
+        wind = pd.read_csv(wind, sep='\t', index_col=0, parse_dates=True)
 
-DIR = np.array(Wind.DIR)              # timeseries of wind direction (°)
-WS = np.array(Wind.WS)                # timeseries of wind speed (m/s)
+    wtime = None
+    if isinstance(wind, tuple):
+        DIR, WS = wind
+    else:
+        DIR, WS = wind['DIR'], wind['WS']
+        if isinstance(wind, xr.Dataset):
+            wtime = pd.DatetimeIndex(np.asarray(wind.time))
+        elif isinstance(wind.index, pd.DatetimeIndex):
+            wtime = wind.index
 
+    if time is not None and wtime is not None:
+        idx = wtime.get_indexer(pd.DatetimeIndex(np.asarray(time)))
+        if np.any(idx < 0):
+            raise ValueError('%d time steps of the forcing are not in the wind data, e.g. %s'
+                             % (np.sum(idx < 0), np.asarray(time)[idx < 0][0]))
+        if np.all(np.diff(idx) == 1):
+            idx = slice(idx[0], idx[-1] + 1)                 # contiguous: one block
+        DIR, WS = DIR[idx], WS[idx]
+    return np.array(DIR), np.array(WS)
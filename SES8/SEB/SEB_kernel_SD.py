@@ -0,0 +1,207 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+## Simplified energy balance model
+## Author:      Franziska Temme, Johannes Fürst
+## Last update: 05.04.2023
+########################################################################################################################
+
+## Time loop of the mass balance model on the glacier cells
+## Accessed by:
+##    SEB_main_SD.py
+##
+## All inputs have the shape (time, ncells) with the glacier cells only (see domain.py), float64 or float32.
+## The time step tt+1 depends on tt, but the cells are independent of each other:
+##    numpy backend:  loop over time, array operations over the cells
+##    numba backend:  blocks of cells in parallel (prange), compiled loop over time in every block
+
+
+########################################################################################################################
+# IMPORT EXTERNAL PACKAGES
+########################################################################################################################
+
+import numpy as np
+
+from jitbackend import njit, prange, useNumba     # SES8, put on the import path by the scripts that run the model
+
+
+########################################################################################################################
+#  NUMPY KERNEL
+########################################################################################################################
+
+def seb_kernel(Snowcorr, alb_s, G, T2, albedo_ice, tau, c1, c0, sec_per_hr, dt, lm, rho_water,
+               snow_depth0, smb_cum0, last):
+
+    nt, nc = np.shape(T2)
+    nsim = nt - 1 if last else nt               # the last time step of a run is not simulated
+    ftype = T2.dtype
+
+    ## create arrays
+    albedo     = np.zeros((nt, nc), ftype)+albedo_ice  # ice albedo
+    Qm         = np.zeros((nt, nc), ftype)             # surface energy balance (W m**-2)
+    snow_depth = np.zeros((nt, nc), ftype)             # snow depth (m w.e.)
+    smb_cum    = np.zeros((nt, nc), ftype)             # cumulative surface mass balance (m w.e.)
+    smb        = np.zeros((nt, nc), ftype)             # surface mass balance (m w.e.)
+    abl        = np.zeros((nt, nc), ftype)             # surface abaltion (m w.e.)
+    acc        = np.zeros((nt, nc), ftype)             # surface accumulation (m w.e.)
+
+    ## state (snow depth and cumulative mass balance of the current time step)
+    sd = np.array(snow_depth0, dtype=ftype)
+    cum = np.array(smb_cum0, dtype=ftype)
+
+    snowy = np.zeros(nc, dtype=bool)             # buffers
+    melt = np.zeros(nc, dtype=bool)
+
+    for tt in np.arange(0,nt):
+
+        snow_depth[tt] = sd
+        smb_cum[tt] = cum
+        if tt == nsim:
+            break
+
+        # get solid accumulation / snowfall
+        acc[tt] = Snowcorr[tt]
+
+        # adjust albedo: if snowfree --> albedo ice, if snow --> albedo snow
+        np.greater(sd, 0.0, out=snowy)
+        np.copyto(albedo[tt], alb_s[tt], where=snowy)
+
+        # calculate surface energy balance
+        np.subtract(1, albedo[tt], out=Qm[tt])
+        np.multiply(Qm[tt], tau, out=Qm[tt])
+        np.multiply(Qm[tt], G[tt], out=Qm[tt])
+        Qm[tt] += c1 * T2[tt]
+        Qm[tt] += c0
+
+        np.greater(Qm[tt], 0.0, out=melt)
+        np.copyto(abl[tt], -Qm[tt] * sec_per_hr * dt / lm / rho_water, where=melt)
+
+        np.add(acc[tt], abl[tt], out=smb[tt])
+
+        #### TIME STEP UPDATE : tt + 1
+
+        # cumulative mass balance
+        np.add(cum, smb[tt], out=cum)
+
+        # calculate snowdepth
+        np.add(sd, smb[tt], out=sd)
+
+        # the snowdepth cannot be smaller than zero
+        np.less(sd, 0.0, out=melt)
+        np.copyto(sd, 0.0, where=melt)
+
+    return albedo, Qm, snow_depth, smb_cum, smb, abl, acc, sd, cum
+
+
+########################################################################################################################
+#  NUMBA KERNEL
+########################################################################################################################
+
+@njit(parallel=True, cache=True)
+def seb_kernel_numba(Snowcorr, alb_s, G, T2, albedo_ice, tau, c1, c0, sec_per_hr, dt, lm, rho_water,
+                     snow_depth0, smb_cum0, last):
+
+    nt, nc = T2.shape
+    nsim = nt - 1 if last else nt               # the last time step of a run is not simulated
+
+    albedo     = np.empty((nt, nc), T2.dtype)
+    Qm         = np.empty((nt, nc), T2.dtype)
+    snow_depth = np.empty((nt, nc), T2.dtype)
+    smb_cum    = np.empty((nt, nc), T2.dtype)
+    smb        = np.empty((nt, nc), T2.dtype)
+    abl        = np.empty((nt, nc), T2.dtype)
+    acc        = np.empty((nt, nc), T2.dtype)
+    sd_end     = snow_depth0.copy()
+    cum_end    = smb_cum0.copy()
+
+    nblock = 256                                    # cells per block
+    for b in prange((nc + nblock - 1) // nblock):
+        j0 = b * nblock
+        j1 = min(nc, j0 + nblock)
+        for tt in range(nt):
+            for j in range(j0, j1):
+                sd = sd_end[j]
+                cum = cum_end[j]
+                snow_depth[tt, j] = sd
+                smb_cum[tt, j] = cum
+
+                if tt == nsim:                      # not simulated
+                    albedo[tt, j] = albedo_ice
+                    Qm[tt, j] = 0.0
+                    abl[tt, j] = 0.0
+                    acc[tt, j] = 0.0
+                    smb[tt, j] = 0.0
+                    continue
+
+                a = Snowcorr[tt, j]
+
+                # albedo: if snowfree --> albedo ice, if snow --> albedo snow
+                if sd > 0.0:
+                    al = alb_s[tt, j]
+                else:
+                    al = albedo_ice
+
+                # surface energy balance
+                q = (1 - al) * tau * G[tt, j] + c1[j] * T2[tt, j] + c0[j]
+                if q > 0.0:
+                    b_ = -q * sec_per_hr * dt / lm / rho_water
+                else:
+                    b_ = 0.0
+
+                albedo[tt, j] = al
+                Qm[tt, j] = q
+                abl[tt, j] = b_
+                acc[tt, j] = a
+                s = a + b_
+                smb[tt, j] = s
+
+                # time step update: tt + 1
+                sd = sd + s
+                if sd < 0.0:
+                    sd = 0.0
+                sd_end[j] = sd
+                cum_end[j] = cum + s
+
+    return albedo, Qm, snow_depth, smb_cum, smb, abl, acc, sd_end, cum_end
+
+
+########################################################################################################################
+#  TIME LOOP
+########################################################################################################################
+
+def seb_timeloop(Snowcorr, alb_s, G, T2, albedo_ice, tau, c1, c0, sec_per_hr, dt, lm, rho_water,
+                 backend='numpy', snow_depth0=None, smb_cum0=None, last=True):
+    """ Run the time loop of the SEB model on the glacier cells
+
+    Snowcorr, alb_s, G, T2 ...... (time, ncells): corrected snowfall (m w.e.), snow albedo,
+                                  radiation (W m**-2) and temperature (°C); the fields are computed in
+                                  float32 if T2 is float32, in float64 otherwise
+    c1, c0 ...................... melt parameters, scalars or one value per cell (ncells), e.g. for ensembles
+    backend ..................... 'numpy', 'numba' or 'auto' (see jitbackend.py)
+    snow_depth0, smb_cum0 ....... state at the first time step (ncells), default 0
+    last ........................ True if the last time step is the end of the run (it is not simulated,
+                                  as in the original model); False for all but the last chunk of a run
+
+    returns the fields (albedo, Qm, snow_depth, smb_cum, smb, abl, acc) with shape (time, ncells)
+    and the state (snow_depth, smb_cum) after the last simulated time step (ncells)
+    """
+    nc = np.shape(T2)[1]
+    ftype = np.float32 if np.asarray(T2).dtype == np.float32 else np.float64
+    snow_depth0 = np.zeros(nc, ftype) if snow_depth0 is None else np.array(snow_depth0, dtype=ftype)
+    smb_cum0 = np.zeros(nc, ftype) if smb_cum0 is None else np.array(smb_cum0, dtype=ftype)
+
+    args = [np.ascontiguousarray(x, dtype=ftype) for x in (Snowcorr, alb_s, G, T2)]
+    if any(np.shape(x) != np.shape(args[3]) for x in args[:3]):
+        raise ValueError('Snowcorr, alb_s, G and T2 must have the same shape (time, ncells), got %s'
+                         % [np.shape(x) for x in args])
+    consts = [float(x) for x in (sec_per_hr, dt, lm, rho_water)]
+    state = [snow_depth0, smb_cum0, bool(last)]
+
+    if useNumba(backend):
+        c1, c0 = [np.ascontiguousarray(np.broadcast_to(np.asarray(x, dtype=float), (nc,))) for x in (c1, c0)]
+        res = seb_kernel_numba(*args, float(albedo_ice), float(tau), c1, c0, *consts, *state)
+    else:
+        c1, c0 = [float(x) if np.ndim(x) == 0 else np.asarray(x, dtype=float) for x in (c1, c0)]
+        res = seb_kernel(*args, float(albedo_ice), float(tau), c1, c0, *consts, *state)
+
+    return res[:7], res[7:]
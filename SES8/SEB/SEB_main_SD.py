@@ -11,178 +11,290 @@
 # IMPORT EXTERNAL PACKAGES
 ########################################################################################################################
 
+## The model can be run from the command line (python SEB_main_SD.py --help) or called from other scripts:
+##    from SEB_main_SD import run_seb
+##    ds = run_seb('../data/ERA5_G_input_bell.nc', params=dict(c1=25))
+## Nothing is read or run at import.
+
 # Import general Python packages
 
 import os
+import sys
+import ast
+import argparse
 import numpy as np
-import importlib
-from datetime import datetime
+import xarray as xr
 
-cwd = os.getcwd()
-print('Your current working directory is :')
-print('   ', cwd)
+# modules shared with the other models (jitbackend, outwriter, domain, forcing, instrument, checkpoint) are in SES8
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
 
 # Import user defined routines and packages
 # loading input data
-from SEB_IO_SD import *
+from SEB_IO_SD import INPUT_NAME, OUTPUT_NAME, DOMAIN_NAME, SVF_NAME, WIND_NAME, open_forcing, read_forcing, load_svf, load_wind
 
 # model parameter setttings
-from SEB_param_SD import *
-
-
-########################################################################################################################
-#  PREPROCESSING
-########################################################################################################################
+from SEB_param_SD import get_params
 
+# snowdrift and snow albedo
+from SEB_preproc_SD import altitude_scaling, svf_table, deposition_factor, wind_sectors, snowdrift, tacc_daily, albedo_snow
 
-##### SOLID PRECIPITATION
+# time loop of the SEB model (numpy or numba backend)
+from SEB_kernel_SD import seb_timeloop
 
-snow = 1.0*Prec
-snow[T2>temp_thresh] = 0.0         # where temperature is below threshold, preciptation is solid
+# output file written in time chunks
+from outwriter import OutputWriter
 
-snow[:,MASK == 0] = np.nan         # only interested over the glacier
+# glacier cells of the domain
+from domain import Domain, loadDomain
 
+# T2 and RRR downscaled from ERA5 during the run
+from forcing import Downscaling
 
-#### SNOWDRIFT
-Snowcorr = np.zeros(np.shape(snow))+np.nan   # empty array
+# run statistics of the stages (switched on with SMB_STATS / SMB_PROFILE or --stats / --profile)
+from instrument import configure, run_stats, stage
 
-Emin = np.min(HGT)                           # minimum altitude
-Emax = np.max(HGT)                           # maximum altitude
-E = ((HGT - Emin) / (Emax - Emin))           # altitude scaling
-E2 = np.array(E.copy())
-E2[E2<0] = 0.0
+# state of the run written to / read from checkpoint files
+from checkpoint import writeCheckpoint, readCheckpoint, restartIndex, checkpointSteps
 
-print('START SNOWDRIFT')
-for i in np.arange(0,len(snow)):             # loop through all time steps
 
-    dir = 5 * int(DIR[i]/5)                  # round directions to 5 deg sectors
-    SVF = np.array(LUT_SVF.sel(count = dir)) # directed sky-view factor for the current wind direction
-
-    Cwind = (WS[i] / 4.56) * E2 * (Dmax * (1 - SVF) - 1) + 0.0  # correction field
-
-    Snowcorr[i,:,:] = (snow[i,:,:] + Cwind * snow[i,:,:])       # snowfall amount is corrected accordingly
-
-Snowcorr[Snowcorr < 0.0] = 0.0                # avoid too much  snow been blown away (more than fallen)
+## output variables: name -> (index in the results of seb_timeloop, attributes, time aggregation)
+OUTPUT_VARS = dict(alpha=(0, dict(long_name='Albedo'), 'mean'),
+                   Qm=(1, dict(units='W/m2', long_name='Melt energy'), 'mean'),
+                   acc=(6, dict(units='m w.e.', long_name='Accumulation'), 'sum'),
+                   abl=(5, dict(units='m w.e.', long_name='Ablation'), 'sum'),
+                   smb=(4, dict(units='m w.e.', long_name='Surface mass balance'), 'sum'))
 
 
 ########################################################################################################################
-#  SMB MODEL
+#  MODEL
 ########################################################################################################################
 
-tmax = len(time)
-
-## create arrays
-albedo     = np.zeros(np.shape(T2))+albedo_ice  # ice albedo
-Qm         = np.zeros(np.shape(T2))             # surface energy balance (W m**-2)
-snow_depth = np.zeros(np.shape(T2))             # snow depth (m w.e.)
-smb_cum    = np.zeros(np.shape(T2))             # cumulative surface mass balance (m w.e.)
-smb        = np.zeros(np.shape(T2))             # surface mass balance (m w.e.)
-abl        = np.zeros(np.shape(T2))             # surface abaltion (m w.e.)
-acc        = np.zeros(np.shape(T2))             # surface accumulation (m w.e.)
-
-## only needed over the glacier mask
-albedo[:,MASK == 0] = np.nan
-Qm[:,MASK == 0] = np.nan
-snow_depth[:,MASK == 0] = np.nan
-smb[:,MASK == 0] = np.nan
-smb_cum[:,MASK == 0] = np.nan
-abl[:,MASK == 0] = np.nan
-acc[:,MASK == 0] = np.nan
-
-## create arrays
-a = np.arange(0,st_p_day)
-Tmax_day = np.zeros((int(len(T2)/st_p_day),len(lats),len(lons)))   # maximum temperature
-snow_day = np.zeros(np.shape(Tmax_day)) + np.nan                   # daily accumulated snow
-tacc_day = np.zeros(np.shape(Tmax_day))                            # daily accumulated temperature
-
-print('START ALBEDO PARAMETRIZATION')
-
-########################################################################################################################
-#  ALBEDO PARAMETRIZATION
-########################################################################################################################
-
-## daily snow sum and T max
-for dd in np.arange(0,len(Tmax_day)):
-    Tmax_day[dd,:,:] = T2[a+(dd*st_p_day),:,:].max(axis = 0)
-    snow_day[dd,:,:] = Snowcorr[a+(dd*st_p_day),:,:].sum(axis = 0)
-
-tacc_day[np.isnan(snow_day)] = np.nan
-
-## accumulated Tmax since last snowfall
-for ii in np.arange(0,len(Tmax_day)):
-    tacc_day[ii,snow_day[ii,:,:] > 0.0] = 0.0
-    tacc_day[ii,(snow_day[ii,:,:]==0) & (Tmax_day[ii,:,:] > 0.0)] = tacc_day[ii-1,(snow_day[ii,:,:]==0) & (Tmax_day[ii,:,:] > 0.0)] + Tmax_day[ii,(snow_day[ii,:,:]==0) & (Tmax_day[ii,:,:] > 0.0)]
-    tacc_day[ii,(snow_day[ii] == 0) & (Tmax_day[ii] <= 0.0)] = tacc_day[ii-1,(snow_day[ii] == 0) & (Tmax_day[ii] <= 0.0)]
-
-tacc_day = tacc_day + 1.0
-
-## compute snow albedo
-# daily
-alb_s = 0.9 - p2 * np.log10(tacc_day)
-
-# snow albedo to model time step
-alb_s_3h = np.repeat(alb_s,st_p_day, axis=0)
-
-#############
-# TIME LOOP START
-# of the mass balance model
-# time index : tt
-# time step  : dt
-# end time   : tmax
-
-print('START SEB SIMULATION')
-
-for tt in np.arange(0,tmax-1):
-
-    # get solid accumulation / snowfall
-    acc[tt,:,:] = Snowcorr[tt,:,:]
-
-    # adjust albedo: if snowfree --> albedo ice, if snow --> albedo snow
-    albedo[tt, snow_depth[tt,:,:] == 0] = albedo_ice
-    albedo[tt, snow_depth[tt,:,:] > 0.0] = alb_s_3h[tt, snow_depth[tt,:,:] > 0.0]
-
-    # calculate surface energy balance
-    Qm[tt,:,:] = (1 - albedo[tt,:,:]) * tau * G[tt,:,:] + c1 * T2[tt,:,:] + c0
-
-    abl[tt,Qm[tt,:,:] > 0.0] = -Qm[tt,Qm[tt,:,:] > 0.0] * sec_per_hr * dt / lm / rho_water
-
-    abl[tt,Qm[tt,:,:] < 0.0] = 0.0
-
-    smb[tt,:,:] = acc[tt,:,:] + abl[tt,:,:]
-
-
-    #### TIME STEP UPDATE : tt + 1
-
-    # cumulative mass balance
-    smb_cum[tt + 1,:,:] = smb_cum[tt,:,:] + smb[tt,:,:]
-
-    # calculate snowdepth
-    snow_depth[tt+1,:,:] = snow_depth[tt,:,:] + (acc[tt,:,:] + abl[tt,:,:])
-
-    # the snowdepth cannot be smaller than zero
-    snow_depth[tt+1,snow_depth[tt+1,:,:] < 0.0] = 0
+def run_seb(forcing=INPUT_NAME, domain=None, svf_lut=SVF_NAME, wind=WIND_NAME, params=None, output=None, verbose=True,
+            hgt_range=None, era5=None, checkpoint=None, restart=None):
+    """ Run the simplified energy balance model
+
+    forcing ....... input file or Dataset with T2 (K), G (W m**-2), RRR (mm), HGT, MASK (read lazily)
+    domain ........ Domain, domain file or None (MASK of the forcing), see domain.py
+    svf_lut ....... look-up table of directed sky-view factors (file, Dataset or DataArray SVFdir)
+    wind .......... wind direction and speed (file of ../wind.py or csv, Dataset/DataFrame with DIR and WS or tuple (DIR, WS))
+    params ........ dictionary with the parameters that differ from SEB_param_SD.py (e.g. dict(c1=25))
+    output ........ None: the results are returned as Dataset (time, lat, lon)
+                    file name: the results are written during the run (every chunk of chunk_days) with the
+                    variables, aggregation and encoding of the out_* parameters; the file name is returned
+    hgt_range ..... (minimum, maximum) altitude for the snowdrift scaling if the forcing is a part (tile) of the domain
+    era5 .......... ERA5 file or Dataset (t2m, tp, z): T2 and RRR are downscaled chunk by chunk with the lapse rates
+                    of the parameters (see forcing.py) instead of read from the forcing, which then only needs G
+    checkpoint .... file the state (snow depth, cumulative mass balance, albedo age) is written to every
+                    checkpoint_days days and at the end of the run (see checkpoint.py)
+    restart ....... checkpoint file of an earlier run: the run starts at the time step of the checkpoint with its
+                    state, the forcing only has to cover the time from there on
+    """
+    p = get_params(**(params or {}))
+    log = print if verbose else (lambda *args: None)
+
+    ds = open_forcing(forcing)
+    time = np.array(ds.time)
+    HGT = ds.HGT                          # DEM
+
+    ########################################################################################################################
+    #  PREPROCESSING
+    ########################################################################################################################
+
+    #### all fields are kept on the glacier cells only, shape (time, ncells); the grid is only used for the output
+    if isinstance(domain, Domain):
+        dom = domain
+    elif domain is None:
+        dom = Domain(np.array(ds.MASK), np.array(ds.lat), np.array(ds.lon), p['dtype'])
+    else:
+        dom = loadDomain(domain, p['dtype'])
+    log('%d glacier cells of %d' % (dom.ncells, dom.mask.size))
+
+    #### restart: state of the checkpoint, the run starts at its time step
+    state0 = {}
+    if restart is not None:
+        tstate, state0 = readCheckpoint(restart, 'seb', dom)
+        i0 = restartIndex(time, tstate)
+        ds = ds.isel(time=slice(i0, None))
+        time = time[i0:]
+        log('RESTART FROM %s AT %s' % (restart, str(tstate)[:16]))
+
+    #### T2 and RRR from ERA5 (downscaled per chunk) instead of the input file
+    downscaling = None
+    if era5 is not None:
+        downscaling = Downscaling(era5, np.array(HGT), np.array(ds.lat), np.array(ds.lon), dom, time,
+                                  p['lapse_T'], p['lapse_RRR'], p['rrr_min'])
+
+    #### SNOWDRIFT
+    DIR, WS = load_wind(wind, time)                       # wind at the time steps of the forcing
+    E2 = altitude_scaling(HGT, dom, hgt_range)           # altitude scaling (ncells)
+    SVF_dirs, SVF = svf_table(load_svf(svf_lut), dom)    # directed sky-view factors, read once (ndir, ncells)
+    Ddir = deposition_factor(SVF, p['Dmax'])             # deposition factor for every wind direction
+    isector = wind_sectors(DIR, SVF_dirs)                # LUT index of the wind direction of every time step
+
+    ########################################################################################################################
+    #  SMB MODEL
+    ########################################################################################################################
+
+    tmax = len(time)
+    st_p_day = p['st_p_day']
+
+    unknown = [name for name in p['out_vars'] if name not in OUTPUT_VARS]
+    if unknown:
+        raise ValueError('unknown output variables %s, use %s' % (unknown, list(OUTPUT_VARS)))
+    out_vars = {name: OUTPUT_VARS[name] for name in p['out_vars']}
+
+    #### the forcing is read and simulated in chunks of chunk_days days; only the state is carried from one
+    #### chunk to the next: snow depth, cumulative mass balance and accumulated Tmax (albedo age)
+    if p['chunk_days'] is None:
+        nchunk = tmax                                # everything in one chunk
+    else:
+        nchunk = int(p['chunk_days']) * st_p_day
+        if nchunk <= 0:
+            raise ValueError('chunk_days must be a positive number of days, got %s' % p['chunk_days'])
+
+    if output is not None:
+        ## output file, written chunk by chunk
+        writer = OutputWriter(output, time, dom, {name: (attrs, how) for name, (i, attrs, how) in out_vars.items()},
+                              p['out_freq'], p['out_mean'],
+                              static=dict(HGT=(np.array(HGT), dict(units='m')), MASK=(np.array(ds.MASK), dict())),
+                              dtype=p['out_dtype'], zlib=p['out_zlib'])
+    else:
+        ## create arrays (glacier cells)
+        fields = {name: np.zeros((tmax,dom.ncells), dom.dtype) for name in out_vars}
+
+    ## state (glacier cells)
+    snow_depth_state = np.zeros(dom.ncells, dom.dtype)        # snow depth (m w.e.)
+    smb_cum_state = np.zeros(dom.ncells, dom.dtype)           # cumulative surface mass balance (m w.e.)
+    tacc_state = np.zeros(dom.ncells, dom.dtype)              # accumulated Tmax since last snowfall
+    if state0:
+        snow_depth_state = state0['snow_depth'].astype(dom.dtype)
+        smb_cum_state = state0['smb_cum'].astype(dom.dtype)
+        tacc_state = state0['tacc'].astype(dom.dtype)
+
+    ## time steps with a checkpoint (at the end of a day); the state of a time step is the state before it
+    if checkpoint is not None:
+        every = None if p['checkpoint_days'] is None else int(p['checkpoint_days']) * st_p_day
+        marks = checkpointSteps(tmax, every, st_p_day)
+        tend = time[-1] + np.timedelta64(int(p['dt'] * 3600), 's')
+
+        def save(t, snow_depth, smb_cum, tacc):
+            log('CHECKPOINT %s' % str(time[t] if t < tmax else tend)[:16])
+            with stage('checkpoint', dom.ncells, 1):
+                writeCheckpoint(checkpoint, 'seb', time[t] if t < tmax else tend, dom,
+                                snow_depth=snow_depth, smb_cum=smb_cum, tacc=tacc)
+
+    with run_stats('seb', ncells=dom.ncells, nt=int(tmax), backend=p['backend'], dtype=p['dtype']):
+        for ichunk, t0 in enumerate(np.arange(0,tmax,nchunk)):
+            sl = slice(t0, min(t0+nchunk, tmax))
+            nt = int(sl.stop - sl.start)
+            log('CHUNK %s - %s' % (str(time[sl.start])[:10], str(time[sl.stop-1])[:10]))
+
+            with stage('read', dom.ncells, nt, chunk=ichunk):
+                T2, G, Prec = read_forcing(ds, sl, dom, downscaling)
+
+            log('START SNOWDRIFT')
+            with stage('snowdrift', dom.ncells, nt, chunk=ichunk):
+                Snowcorr = snowdrift(T2, Prec, WS[sl], isector[sl], E2, Ddir, p['temp_thresh'])
+
+            log('START ALBEDO PARAMETRIZATION')
+            with stage('albedo', dom.ncells, nt, chunk=ichunk):
+                tacc_day = tacc_daily(T2, Snowcorr, tacc_state, st_p_day)
+                tacc_state = tacc_day[-1].copy()
+                alb_s_3h = albedo_snow(tacc_day, p['p2'], st_p_day, len(T2))
+
+            #############
+            # TIME LOOP START
+            # of the mass balance model
+            # time index : tt
+            # time step  : dt
+            # end time   : tmax
+
+            log('START SEB SIMULATION')
+
+            with stage('timeloop', dom.ncells, nt, chunk=ichunk):
+                res, (snow_depth_state, smb_cum_state) = seb_timeloop(
+                    Snowcorr, alb_s_3h, G, T2,
+                    p['albedo_ice'], p['tau'], p['c1'], p['c0'], p['sec_per_hr'], p['dt'], p['lm'], p['rho_water'], p['backend'],
+                    snow_depth_state, smb_cum_state, last=(sl.stop == tmax))
+
+            if output is not None:
+                log('WRITING OUTPUT TO FILE')
+                with stage('write', dom.ncells, nt, chunk=ichunk):
+                    writer.write(t0, **{name: res[i] for name, (i, attrs, how) in out_vars.items()})
+            else:
+                for name, (i, attrs, how) in out_vars.items():
+                    fields[name][sl] = res[i]
+
+            if checkpoint is not None:
+                for t in [t for t in marks if sl.start < t <= sl.stop]:
+                    k = t - sl.start
+                    if t < sl.stop:
+                        save(t, res[2][k], res[3][k], tacc_day[k // st_p_day - 1])
+                    elif t < tmax:
+                        save(t, snow_depth_state, smb_cum_state, tacc_day[-1])
+                    else:
+                        ## end of the run: the last time step is simulated for the state after it
+                        last_step = seb_timeloop(
+                            Snowcorr[-1:], alb_s_3h[-1:], G[-1:], T2[-1:],
+                            p['albedo_ice'], p['tau'], p['c1'], p['c0'], p['sec_per_hr'], p['dt'], p['lm'], p['rho_water'], p['backend'],
+                            snow_depth_state, smb_cum_state, last=False)[1]
+                        save(t, *last_step, tacc_day[-1])
+
+        ########################################################################################################################
+        #  OUTPUT            #
+        ########################################################################################################################
+
+        if output is not None:
+            with stage('write'):
+                writer.close()               # all chunks are already in the file
+            return output
+
+        with stage('output', dom.ncells, tmax):
+            out = xr.Dataset(coords=dict(time=ds.time, lat=ds.lat, lon=ds.lon))
+            for name, (i, attrs, how) in out_vars.items():
+                out[name] = xr.DataArray(dom.scatter(fields[name]), dims=['time','lat','lon'], attrs=attrs)
+
+    return out
 
 
 ########################################################################################################################
-#  WRITE OUTPUT            #
+#  COMMAND LINE
 ########################################################################################################################
-print('WRITING OUTPUT TO FILE')
-
-ALB = xr.DataArray(albedo, dims=['time','lat','lon'], attrs=dict(long_name='Albedo'))
-ds['alpha'] = ALB
-
-QM = xr.DataArray(Qm, dims=['time','lat','lon'], attrs=dict(units='W/m2', long_name='Melt energy'))
-ds['Qm'] = QM
-
-ACC = xr.DataArray(acc, dims=['time','lat','lon'], attrs=dict(units='m w.e.', long_name='Accumulation'))
-ds['acc'] = ACC
-
-ABL = xr.DataArray(abl, dims=['time','lat','lon'], attrs=dict(units='m w.e.', long_name='Ablation'))
-ds['abl'] = ABL
-
-SMB = xr.DataArray(smb, dims=['time','lat','lon'], attrs=dict(units='m w.e.', long_name='Surface mass balance'))
-ds['smb'] = SMB
-
-ds.to_netcdf(OUTPUT_NAME)
 
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Simplified energy balance model')
+    parser.add_argument('--input', default=INPUT_NAME, help='input file (T2, G, RRR, HGT, MASK)')
+    parser.add_argument('--output', default=OUTPUT_NAME, help='output file')
+    parser.add_argument('--domain', default=DOMAIN_NAME, help='file with the glacier MASK')
+    parser.add_argument('--svf', default=SVF_NAME, help='look-up table of directed sky-view factors')
+    parser.add_argument('--wind', default=WIND_NAME, help='wind direction and speed (NetCDF of wind.py or csv)')
+    parser.add_argument('--era5', default=None, help='ERA5 file (t2m, tp, z): T2 and RRR are downscaled during the run')
+    parser.add_argument('--set', nargs='*', default=[], metavar='NAME=VALUE',
+                        help='parameters that differ from SEB_param_SD.py, e.g. --set c1=25 backend=numba')
+    parser.add_argument('--checkpoint', default=None, help='file for the state of the run (every checkpoint_days and at the end)')
+    parser.add_argument('--restart', default=None, help='checkpoint file to continue a run from')
+    parser.add_argument('--stats', default=os.environ.get('SMB_STATS'),
+                        help="file for the run statistics of the stages (JSON lines, '-': standard error)")
+    parser.add_argument('--profile', default=os.environ.get('SMB_PROFILE'), help='file for a cProfile dump of the run')
+    args = parser.parse_args(argv)
+    configure(args.stats, args.profile)
+
+    params = {}
+    for item in args.set:
+        name, value = item.split('=', 1)
+        try:
+            params[name] = ast.literal_eval(value)   # numbers, True/False, None
+        except (ValueError, SyntaxError):
+            params[name] = value                     # strings (e.g. backend=numba)
+
+    print('Your current working directory is :')
+    print('   ', os.getcwd())
+
+    run_seb(args.input, args.domain, args.svf, args.wind, params, args.output, era5=args.era5,
+            checkpoint=args.checkpoint, restart=args.restart)
+
+
+if __name__ == '__main__':
+    main()
@@ -22,10 +22,21 @@ rho_ice    = 917.          # density of ice (kg/m3)
 ## general model settings
 dt        = 6              # model time step (hours)
 st_p_day = int(24/dt)          # how many steps per day do we have?
+backend   = 'numpy'        # time loop: 'numpy', 'numba' (compiled, parallel over the glacier cells) or 'auto' (numba if installed)
+dtype     = 'f8'           # data type of the model fields on the glacier cells: 'f8' or 'f4' (half the memory)
+chunk_days = None          # None: read and simulate the whole record at once; number of days: read the forcing in
+                           # chunks of chunk_days days and append every chunk to the output file (bounded memory)
+checkpoint_days = None     # with a checkpoint file (run_seb(..., checkpoint=...)): days between the checkpoints of the
+                           # state, None: only at the end of the run
 
 ## input data parameters
 temp_thresh =  1.8         # temperature threshold for solid prec.  (˚C )
 
+## downscaling of ERA5 during the run (only with run_seb(..., era5=...), see ../forcing.py)
+lapse_T    = -6.5/1000     # temperature lapse rate (K/m)
+lapse_RRR  = 0.10/100      # precipitation gradient (mm/m)
+rrr_min    = 0.20          # ERA5 precipitation (mm) up to which no precipitation is assumed
+
 
 ## SNOWDRIFT model parameters
 Dmax = 8                   # maximum deposition
@@ -47,3 +58,30 @@ c0                   = -40     # empirical factor (W m**-2)
 albedo_snow          =  0.9    # albedo of snow
 albedo_ice           =  0.4    # albedo of ice
 p2                   = 0.155   # empirical parameter (Gabbi et al. 2014, Journal of Glaciology)
+
+
+## output settings
+out_vars   = ['alpha', 'Qm', 'acc', 'abl', 'smb']   # variables written to the output file
+out_freq   = 'native'      # time aggregation: 'native' (every time step), 'daily', 'monthly' or 'annual'
+out_mean   = False         # True: glacier-wide means instead of grids
+out_dtype  = 'f4'          # data type in the output file ('f4' or 'f8')
+out_zlib   = True          # compress the output file
+
+## all parameters above as a dictionary (used by run_seb in SEB_main_SD.py), single values can be replaced:
+##    params = get_params(c1=25, backend='numba')
+def get_params(**overrides):
+
+    p = {k: v for k, v in globals().items()
+         if not k.startswith('_') and isinstance(v, (bool, int, float, str, list, type(None)))}
+    unknown = [k for k in overrides if k not in p]
+    if unknown:
+        raise ValueError('unknown SEB parameters: %s' % unknown)
+    p.update(overrides)
+
+    ## derived parameters (unless they are given explicitly)
+    if 'st_p_day' not in overrides:
+        p['st_p_day'] = int(24/p['dt'])
+    if 'tau' not in overrides:
+        p['tau'] = p['transmissivity'] if p['potential_radiation'] else 1.0
+
+    return p
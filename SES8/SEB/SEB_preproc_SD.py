@@ -0,0 +1,136 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+## Simplified energy balance model
+## Author:      Franziska Temme, Johannes Fürst
+## Last update: 05.04.2023
+########################################################################################################################
+
+## Preprocessing of the mass balance model: solid precipitation, snowdrift and snow albedo
+## Accessed by:
+##    SEB_main_SD.py
+##    ../ensemble.py
+##
+## All fields have the shape (time, ncells) with the glacier cells only (see domain.py).
+## The parameters are passed as arguments, so the same functions serve single runs and ensembles.
+
+
+########################################################################################################################
+# IMPORT EXTERNAL PACKAGES
+########################################################################################################################
+
+import numpy as np
+
+
+########################################################################################################################
+#  SNOWDRIFT
+########################################################################################################################
+
+#### altitude scaling of the snowdrift on the glacier cells (ncells)
+#### hgt_range: (minimum, maximum) altitude of the whole domain if HGT is only a part of it (e.g. a tile)
+def altitude_scaling(HGT, dom, hgt_range=None):
+
+    if hgt_range is None:
+        hgt_range = (np.min(HGT), np.max(HGT))
+    Emin, Emax = hgt_range                       # minimum and maximum altitude
+    E = ((HGT - Emin) / (Emax - Emin))           # altitude scaling
+    E2 = np.array(E.copy())
+    E2[E2<0] = 0.0
+
+    return dom.gather(E2)
+
+
+#### look-up table of directed sky-view factors on the glacier cells: wind directions (ndir) and SVF (ndir, ncells)
+def svf_table(LUT_SVF, dom):
+
+    SVF_dirs = np.asarray(LUT_SVF['count'])
+    SVF = dom.gather(LUT_SVF.transpose('count', 'lat', 'lon'))
+
+    return SVF_dirs, SVF
+
+
+#### deposition factor Dmax * (1 - SVF) - 1 for every wind direction of the look-up table (ndir, ncells)
+def deposition_factor(SVF, Dmax):
+    return Dmax * (1 - SVF) - 1
+
+
+#### wind direction of every time step rounded to 5 deg sectors -> index in the look-up table
+def wind_sectors(DIR, SVF_dirs):
+
+    sector = (5 * np.trunc(np.asarray(DIR, dtype=float) / 5)) % 360
+    isector = np.minimum(np.searchsorted(SVF_dirs, sector), len(SVF_dirs)-1)
+    if np.any(SVF_dirs[isector] != sector):
+        raise ValueError('wind directions without sky-view factor in the look-up table: %s'
+                         % np.unique(sector[SVF_dirs[isector] != sector]))
+
+    return isector
+
+
+#### solid precipitation corrected for snowdrift, all time steps at once
+#### T2 (°C), Prec (m): (time, ncells); WS, isector: wind speed and LUT index of the same time steps (time)
+def snowdrift(T2, Prec, WS, isector, E2, Ddir, temp_thresh):
+
+    snow = 1.0*Prec
+    snow[T2>temp_thresh] = 0.0         # where temperature is below threshold, preciptation is solid
+
+    Cwind = (np.asarray(WS).reshape(-1,1) / 4.56) * E2 * Ddir[isector] + 0.0  # correction field (time, ncells)
+
+    Snowcorr = (snow + Cwind * snow).astype(np.asarray(T2).dtype, copy=False)   # snowfall amount is corrected accordingly
+
+    Snowcorr[Snowcorr < 0.0] = 0.0                # avoid too much  snow been blown away (more than fallen)
+
+    return Snowcorr
+
+
+########################################################################################################################
+#  ALBEDO PARAMETRIZATION
+########################################################################################################################
+
+#### accumulated Tmax since last snowfall for the days of one chunk (nday, ncells)
+#### (a last incomplete day is aggregated over the available time steps)
+#### tacc_prev: accumulated Tmax at the end of the previous chunk (zero at the start)
+def tacc_daily(T2, Snowcorr, tacc_prev, st_p_day):
+
+    nt, nc = np.shape(T2)
+    nday = -(-nt // st_p_day)                 # number of (started) days
+    npad = nday * st_p_day - nt
+
+    ## daily snow sum and T max
+    Tmax_day = np.concatenate([T2, np.full((npad, nc), -np.inf, T2.dtype)]).reshape(nday, st_p_day, nc).max(axis=1)
+    snow_day = np.concatenate([Snowcorr, np.zeros((npad, nc), Snowcorr.dtype)]).reshape(nday, st_p_day, nc).sum(axis=1)
+
+    ## accumulated Tmax since last snowfall:
+    ##   snowfall                  --> 0 (reset)
+    ##   no snowfall and Tmax > 0  --> previous day + Tmax
+    ##   no snowfall and Tmax <= 0 --> previous day
+    ## computed as cumulative sum of the increments minus the cumulative sum at the last reset (segmented cumsum)
+    nosnow = (snow_day == 0)
+    inc = np.where(nosnow & (Tmax_day > 0.0), Tmax_day, 0.0)
+    reset = (snow_day > 0.0) | (nosnow & np.isnan(Tmax_day))    # no temperature: accumulation starts again
+    missing = np.isnan(snow_day)                                  # no snow data: nan until the next reset
+
+    day = np.arange(nday).reshape(-1, 1)
+    last = np.maximum.accumulate(np.where(reset, day, -1), axis=0)  # day of the last reset (-1: none in this chunk)
+    before = (last < 0)
+    last = np.maximum(last, 0)
+
+    Csum = np.cumsum(inc, axis=0)
+    tacc_day = np.where(before, tacc_prev + Csum, Csum - np.take_along_axis(Csum, last, axis=0))
+
+    Nsum = np.cumsum(missing, axis=0)
+    tacc_day[(Nsum - np.where(before, 0, np.take_along_axis(Nsum, last, axis=0))) > 0] = np.nan
+
+    return tacc_day.astype(T2.dtype, copy=False)
+
+
+#### snow albedo at model time step (nt, ncells) from the accumulated Tmax of every day
+def albedo_snow(tacc_day, p2, st_p_day, nt):
+
+    tacc_day = tacc_day + 1.0
+
+    ## compute snow albedo
+    # daily
+    alb_s = 0.9 - p2 * np.log10(tacc_day)
+
+    # snow albedo to model time step
+    return np.repeat(alb_s,st_p_day, axis=0)[:nt]
@@ -2,98 +2,247 @@
 #### 22.03.22, last update 02.03.2023
 #### Author: Franziska Temme
 ########################################################################################################################
+#### The sky-view factor for one wind direction DIR is the fraction of (azimuth, elevation) pairs in the window
+#### DIR +/- width (azimuth) x EL (elevation) under which a glacier cell "sees" the sky.
+#### The contribution of every azimuth is computed once (in parallel, one task per azimuth) and shared by all
+#### directions whose window contains it. Each direction is written to the output file as soon as all its
+#### azimuths are finished, so an interrupted run can be resumed.
+####
+#### usage:  python LUT_SVFdir45.py --dom ../../SES6/dom/Bell_dom.nc --out ./LUT_SVFdir45.nc --workers 4
+########################################################################################################################
 
 #### import
+import os
+import sys
+import argparse
+import tempfile
+import concurrent.futures
 import numpy as np
-import pandas as pd
 import xarray as xr
+import netCDF4
 import math
 
 # Import user defined routines and packages
 # loading input data
 from relshadFunct_SD import *
+from horizonCache import demKey, cachedHorizon
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from instrument import configure, settings, run_stats, stage
 
-#### read in necessary input
-ds = xr.open_dataset('/home/christian/curso-glacio-apuandes/SES6/dom/Bell_dom.nc')
-DEM = np.array(ds.HGT)
-MASK = np.array(ds.MASK)
-ASP = np.array(ds.ASPECT)+180
-SLO = np.array(ds.SLOPE)
-lats = np.array(ds.lat)
-lons = np.array(ds.lon)
+#### default settings
+DOMFILE = '../../SES6/dom/Bell_dom.nc'   # domain file (HGT, MASK, SLOPE, ASPECT)
+OUTFILE = './LUT_SVFdir45.nc'            # output look-up table
+STEP = 5                                 # resolution of the wind directions and azimuths (deg)
+WIDTH = 20                               # half width of the azimuth window around the wind direction (deg)
+EL_STEP = 10                             # resolution of the solar elevations (deg), EL = 2, 2+EL_STEP, ... < 90
 
+#### data shared with the workers (memory-mapped, set by initWorker)
+_shared = {}
 
+
+########################################################################################################################
+#### HELPER FUNCTIONS
 ########################################################################################################################
 
-slo = np.radians(SLO)
-asp = np.radians(ASP)
-directions = np.arange(0,360,5)
+#### azimuths in the window of a wind direction (between 0 and 360)
+def windowAzimuths(DIR,step=STEP,width=WIDTH):
+    AZI = DIR + np.arange(-width, width + step, step)
+    AZI[AZI < 0] = AZI[AZI < 0] + 360
+    AZI[AZI >= 360] = AZI[AZI >= 360] - 360
+    return AZI
 
-#### empty array to fill
-LUT_SVFdir = np.zeros((len(directions),len(lats),len(lons)))
-i = 0
 
+#### write the static fields to .npy files that the workers open as memmap (instead of pickling them per task)
+def shareArrays(folder,**arrays):
+    for name, arr in arrays.items():
+        np.save(os.path.join(folder, name + '.npy'), np.ascontiguousarray(arr))
 
-############ START
 
-for DIR in directions:    # go trough all wind directions in 5 deg steps
-    print(DIR)
-    res = DEM*0
-    count = 0
+#### config: (stats, profile) of the main process (see instrument.settings), the workers record their stages too
+def initWorker(folder,key,cachedir,config=(None,None)):
+    for name in ['DEM', 'MASK', 'lats', 'lons', 'slo', 'asp']:
+        _shared[name] = np.load(os.path.join(folder, name + '.npy'), mmap_mode='r')
+    _shared['key'] = key
+    _shared['cachedir'] = cachedir
+    configure(*config)
 
-    # azimuth with winddireciton +/- 45 °
-    AZI =  np.array([DIR-20, DIR-15, DIR-10, DIR-5, DIR, DIR+5, DIR+10, DIR+15, DIR+20])
 
-    # check that AZI is between 0 and 360
-    AZI[AZI < 0] = AZI[AZI < 0] + 360
-    AZI[AZI >= 360] = AZI[AZI >= 360] - 360
+#### number of (elevation) cases in which the cells see the sky for one azimuth
+def azimuthContribution(azi,EL):
+    DEM, MASK, lats, lons = _shared['DEM'], _shared['MASK'], _shared['lats'], _shared['lons']
+    slo, asp = _shared['slo'], _shared['asp']
 
-    EL = np.arange(2,90,10)
+    with stage('horizon', azimuth=float(azi)):   # in the worker process of the azimuth
+        Hmax = cachedHorizon(DEM,MASK,lats,lons,azi,cachedir=_shared['cachedir'],key=_shared['key'])   # horizon once per azimuth (cached)
+        ILLU = illuFromHorizon(Hmax,MASK,EL)                                                            # illumination for all elevations
 
-    for azi in AZI:
-        for el in EL:
-            illu, Hmax = relshad(DEM,MASK,lats,lons,el,azi)
+        res = np.zeros(np.shape(DEM))
+        for iel, el in enumerate(EL):
             a = ((math.cos(np.radians(el)) * np.sin(slo) * np.cos(asp - np.radians(azi))) + (np.sin(np.radians(el)) * np.cos(slo)))
             a[a < 0] = 0
             a[a > 0] = 1
-            a[illu == 0] = 0
+            a[ILLU[iel,:,:] == 0] = 0
             res = res + a
-            count = count + 1
 
-    vsky = DEM*0
-    vsky[:,:] = np.nan
-    vsky[MASK == 1] = res[MASK == 1]/(len(AZI)*len(EL))
+    return azi, res
 
-    LUT_SVFdir[int(DIR/5),:,:] = vsky
-    #LUT_SVFdir[i,:,:] = vsky
-    #i = i+1
 
+#### create the output file (static fields, empty SVFdir and a flag for the finished directions)
+def createOutput(outfile,domfile,directions,step,width,EL):
+    ds = xr.open_dataset(domfile)
+    ds_SVF = xr.Dataset()
+    ds_SVF.coords['lon'] = ds.lon.values
+    ds_SVF.lon.attrs['standard_name'] = 'lon'
+    ds_SVF.lon.attrs['long_name'] = 'longitude'
+    ds_SVF.lon.attrs['units'] = 'degrees_east'
 
+    ds_SVF.coords['lat'] = ds.lat.values
+    ds_SVF.lat.attrs['standard_name'] = 'lat'
+    ds_SVF.lat.attrs['long_name'] = 'latitude'
+    ds_SVF.lat.attrs['units'] = 'degrees_north'
 
-LUT_SVFdir = xr.DataArray(LUT_SVFdir, dims = ['count','lat', 'lon'])
+    ds_SVF.coords['count'] = directions
+    ds_SVF['count'].attrs['long_name'] = 'wind direction'
+    ds_SVF['count'].attrs['units'] = 'deg'
 
+    ds_SVF['HGT'] = ds.HGT
+    ds_SVF['MASK'] = ds.MASK
+    ds_SVF['SLOPE'] = ds.SLOPE
+    ds_SVF['ASPECT'] = ds.ASPECT+180
+    ds_SVF['SVFdir'] = (('count', 'lat', 'lon'), np.zeros((len(directions), len(ds.lat), len(ds.lon))) + np.nan)
+    ds_SVF['done'] = (('count',), np.zeros(len(directions), dtype=np.int8))
+    ds_SVF['done'].attrs['long_name'] = 'direction finished (1) or not (0)'
 
+    ds_SVF.attrs['step'] = step
+    ds_SVF.attrs['width'] = width
+    ds_SVF.attrs['elevations'] = np.asarray(EL, dtype=float)
 
-### writing out
-ds_SVF = xr.Dataset()
-ds_SVF.coords['lon'] = ds.lon.values
-ds_SVF.lon.attrs['standard_name'] = 'lon'
-ds_SVF.lon.attrs['long_name'] = 'longitude'
-ds_SVF.lon.attrs['units'] = 'degrees_east'
+    ds_SVF.to_netcdf(outfile)
+    ds.close()
 
-ds_SVF.coords['lat'] = ds.lat.values
-ds_SVF.lat.attrs['standard_name'] = 'lat'
-ds_SVF.lat.attrs['long_name'] = 'latitude'
-ds_SVF.lat.attrs['units'] = 'degrees_north'
 
-ds_SVF.coords['count'] = directions
-ds_SVF.lat.attrs['standard_name'] = 'count'
+#### directions already in the output file (empty if the file does not exist or was made with other settings)
+def finishedDirections(outfile,directions,step,width,EL):
+    if not os.path.exists(outfile):
+        return None
+    with xr.open_dataset(outfile) as ds_old:
+        if ('done' not in ds_old) or (ds_old.attrs.get('step') != step) or (ds_old.attrs.get('width') != width) \
+                or (not np.array_equal(np.atleast_1d(ds_old.attrs.get('elevations')), np.asarray(EL, dtype=float))) \
+                or (not np.array_equal(ds_old['count'].values, directions)):
+            return None
+        return set(directions[ds_old.done.values == 1].tolist())
 
-ds_SVF['HGT'] = ds.HGT
-ds_SVF['MASK'] = ds.MASK
-ds_SVF['SLOPE'] = ds.SLOPE
-ds_SVF['ASPECT'] = ds.ASPECT+180
-ds_SVF['SVFdir'] = LUT_SVFdir
 
+########################################################################################################################
+#### LUT BUILDER
+########################################################################################################################
+
+def buildLUT(domfile=DOMFILE,outfile=OUTFILE,step=STEP,width=WIDTH,el_step=EL_STEP,workers=None,
+             cachedir='./horizon_cache',resume=True):
+
+    with run_stats('lut', workers=workers, step=step, width=width, el_step=el_step):
+
+        #### read in necessary input
+        with stage('read'):
+            ds = xr.open_dataset(domfile)
+            DEM = np.array(ds.HGT)
+            MASK = np.array(ds.MASK)
+            ASP = np.array(ds.ASPECT)+180
+            SLO = np.array(ds.SLOPE)
+            lats = np.array(ds.lat)
+            lons = np.array(ds.lon)
+
+            ds.close()
+
+        slo = np.radians(SLO)
+        asp = np.radians(ASP)
+        directions = np.arange(0,360,step)
+        EL = np.arange(2,90,el_step)
+
+        #### output file: resume or start from scratch
+        done = finishedDirections(outfile,directions,step,width,EL) if resume else None
+        if done is None:
+            createOutput(outfile,domfile,directions,step,width,EL)
+            done = set()
+        todo = [DIR for DIR in directions if DIR not in done]
+        print('%d of %d directions to compute' % (len(todo), len(directions)))
+        if len(todo) == 0:
+            return outfile
+
+        #### azimuths needed by the remaining directions
+        windows = {DIR: windowAzimuths(DIR,step,width) for DIR in todo}
+        needed = sorted(set(np.concatenate(list(windows.values())).tolist()))
+        users = {azi: [DIR for DIR in todo if azi in windows[DIR]] for azi in needed}
+
+        KEY = demKey(DEM,MASK,lats,lons)   # horizons are cached in cachedir/KEY (reused in later runs)
+        contrib = {}
+
+        with tempfile.TemporaryDirectory() as shared:
+            shareArrays(shared,DEM=DEM,MASK=MASK,lats=lats,lons=lons,slo=slo,asp=asp)
+            nc = netCDF4.Dataset(outfile, 'a')
+            try:
+                pool = None
+                if workers == 1:
+                    initWorker(shared,KEY,cachedir,settings())
+                    results = (azimuthContribution(azi,EL) for azi in needed)
+                else:
+                    pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=initWorker,
+                                                                  initargs=(shared,KEY,cachedir,settings()))
+                    futures = [pool.submit(azimuthContribution,azi,EL) for azi in needed]
+                    results = (f.result() for f in concurrent.futures.as_completed(futures))
+
+                ## stages (disjoint): horizon per azimuth (in the workers), svf and write per direction
+                for azi, res in results:
+                    contrib[azi] = res
+
+                    ## write all directions that have their complete azimuth window
+                    for DIR in users[azi]:
+                        if (DIR in done) or any(a not in contrib for a in windows[DIR]):
+                            continue
+                        with stage('svf', direction=float(DIR)):
+                            total = np.sum([contrib[a] for a in windows[DIR]], axis=0)
+                            vsky = DEM*0.0
+                            vsky[:,:] = np.nan
+                            vsky[MASK == 1] = total[MASK == 1]/(len(windows[DIR])*len(EL))
+
+                        i = int(np.where(directions == DIR)[0][0])
+                        with stage('write', direction=float(DIR)):
+                            nc['SVFdir'][i,:,:] = vsky
+                            nc['done'][i] = 1
+                            nc.sync()
+                        done.add(DIR)
+                        print('DIR %5.1f finished (%d/%d)' % (DIR, len(done), len(directions)))
+
+                    ## contributions that are not needed anymore
+                    for a in [a for a in contrib if all(DIR in done for DIR in users[a])]:
+                        del contrib[a]
+            finally:
+                if pool is not None:
+                    pool.shutdown(cancel_futures=True)
+                nc.close()
+
+        return outfile
+
+
+########################################################################################################################
+#### COMMAND LINE
+########################################################################################################################
 
-ds_SVF.to_netcdf('./LUT_SVFdir45.nc')
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Look-up table of directed sky-view factors')
+    parser.add_argument('--dom', default=DOMFILE, help='domain file with HGT, MASK, SLOPE and ASPECT')
+    parser.add_argument('--out', default=OUTFILE, help='output file')
+    parser.add_argument('--step', type=int, default=STEP, help='resolution of wind directions/azimuths (deg)')
+    parser.add_argument('--width', type=int, default=WIDTH, help='half width of the azimuth window (deg)')
+    parser.add_argument('--el-step', type=int, default=EL_STEP, help='resolution of solar elevations (deg)')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all cores)')
+    parser.add_argument('--cache', default='./horizon_cache', help='folder of the horizon cache')
+    parser.add_argument('--restart', action='store_true', help='do not resume a previous run, start from scratch')
+    parser.add_argument('--stats', default=os.environ.get('SMB_STATS'),
+                        help="file for the run statistics of the stages (JSON lines, '-': standard error)")
+    parser.add_argument('--profile', default=os.environ.get('SMB_PROFILE'), help='file for a cProfile dump of the run')
+    args = parser.parse_args()
+    configure(args.stats, args.profile)
+
+    buildLUT(args.dom,args.out,args.step,args.width,args.el_step,args.workers,args.cache,not args.restart)
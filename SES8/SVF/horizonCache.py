@@ -0,0 +1,104 @@
+#### Cache for horizon angles (Hmax) used in the relief shading
+#### Hmax only depends on the DEM, the mask, the coordinates and the azimuth. It is stored on disk
+#### (one NetCDF file per azimuth, in a folder named after a hash of the DEM) and kept in memory
+#### for the most recently used azimuths, so the LUT of directed sky-view factors can be rebuilt
+#### without any ray tracing after the first run.
+########################################################################################################################
+#### INPUT: see relshadFunct_SD.py
+#### cachedir: folder of the cache on disk (None: only keep the horizons in memory)
+########################################################################################################################
+##### START FUNCTION #####
+########################################################################################################################
+#### import
+import os
+import hashlib
+import collections
+import numpy as np
+import xarray as xr
+
+from relshadFunct_SD import horizon, illuFromHorizon
+
+#### settings
+CACHE_DIR = './horizon_cache'   # default folder of the cache on disk
+MAXSIZE = 128                   # number of horizon fields kept in memory
+VERSION = 4                     # increase when the horizon computation changes (invalidates old caches)
+
+_mem = collections.OrderedDict()   # in-memory cache: (key, azimuth) -> Hmax
+
+
+#### KEY of the DEM (hash of DEM, mask and coordinates)
+def demKey(dem,mask,lats,lons):
+    h = hashlib.sha1(('horizon-v%d' % VERSION).encode())
+    for arr in (dem, mask, lats, lons):
+        a = np.ascontiguousarray(arr, dtype=np.float64)
+        h.update(str(a.shape).encode())
+        h.update(a.tobytes())
+    return h.hexdigest()[:16]
+
+
+#### HORIZON ANGLES with cache
+#### key can be passed (from demKey) to avoid hashing the DEM in every call
+def cachedHorizon(dem,mask,lats,lons,sdirfn,cachedir=CACHE_DIR,key=None):
+
+    if key is None:
+        key = demKey(dem,mask,lats,lons)
+    azi = round(float(sdirfn) % 360.0, 6)
+
+    ## 1) memory
+    if (key, azi) in _mem:
+        _mem.move_to_end((key, azi))
+        return _mem[(key, azi)]
+
+    ## 2) disk
+    fname = None
+    if cachedir is not None:
+        fname = os.path.join(cachedir, key, 'Hmax_%010.6f.nc' % azi)
+
+    if (fname is not None) and os.path.exists(fname):
+        with xr.open_dataarray(fname) as da:
+            Hmax = np.array(da.values)
+    else:
+        ## 3) compute and write to disk
+        Hmax = horizon(dem,mask,lats,lons,azi)
+        if fname is not None:
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+            da = xr.DataArray(Hmax, dims=['lat', 'lon'], coords=dict(lat=np.asarray(lats), lon=np.asarray(lons)),
+                              name='Hmax', attrs=dict(units='deg', long_name='Horizon angle', azimuth=azi))
+            tmp = fname + '.tmp%d' % os.getpid()
+            da.to_netcdf(tmp)
+            os.replace(tmp, fname)   # no half-written files if the run is interrupted
+
+    Hmax.flags.writeable = False     # shared between calls, do not modify in place
+    _mem[(key, azi)] = Hmax
+    while len(_mem) > MAXSIZE:
+        _mem.popitem(last=False)     # drop least recently used
+
+    return Hmax
+
+
+#### RELIEF SHADING FUNCTION with cache
+#### same output as relshad/relshadVec; solh can be a list of elevations (see illuFromHorizon)
+def relshadCached(dem,mask,lats,lons,solh,sdirfn,cachedir=CACHE_DIR,key=None):
+
+    Hmax = cachedHorizon(dem,mask,lats,lons,sdirfn,cachedir,key)
+    illu = illuFromHorizon(Hmax,mask,solh)
+
+    return (illu,Hmax)
+
+
+#### EMPTY the in-memory cache (the files on disk are kept)
+def clearMemory():
+    _mem.clear()
+
+
+#### LOOK-UP TABLE of horizon angles for all azimuths (e.g. for the terrain shading of the radiation, radCor.py)
+#### output: DataArray Hmax (azimuth, lat, lon) with azimuths 0, step, ..., 360-step
+def horizonLookup(dem,mask,lats,lons,step=5,cachedir=CACHE_DIR):
+
+    key = demKey(dem,mask,lats,lons)
+    azimuths = np.arange(0, 360, step, dtype=float)
+    Hmax = np.stack([cachedHorizon(dem,mask,lats,lons,azi,cachedir,key) for azi in azimuths])
+
+    return xr.DataArray(Hmax, dims=['azimuth', 'lat', 'lon'],
+                        coords=dict(azimuth=azimuths, lat=np.asarray(lats), lon=np.asarray(lons)),
+                        name='Hmax', attrs=dict(units='deg', long_name='Horizon angle'))
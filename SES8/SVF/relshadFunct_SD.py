@@ -110,3 +110,160 @@ def relshad(dem,mask,lats,lons,solh,sdirfn):
 
     return (illu,Hmax)
 
+
+
+#### VECTORIZED HAVERSINE (same as haversine, but for numpy arrays)
+def haversineVec(lat1,lon1,lat2,lon2):
+    lat1_rad = np.radians(lat1)
+    lat2_rad = np.radians(lat2)
+    delta_lat = lat2_rad-lat1_rad
+    delta_lon = np.radians(lon2)-np.radians(lon1)
+    a = ((np.sin(delta_lat/2))**2 + np.cos(lat1_rad)*np.cos(lat2_rad)*(np.sin(delta_lon/2))**2)**0.5
+    d = 2*6371000*np.arcsin(a)
+    return d
+
+
+#### NEAREST GRID POINT (same as np.abs(coords - value).argmin() in relshad, for many values at once)
+def nearestIndex(coords,values):
+    coords = np.asarray(coords, dtype=float)
+    values = np.asarray(values, dtype=float)
+    order = np.argsort(coords, kind='stable')
+    pos = np.searchsorted(coords[order], values)
+    lo = order[np.clip(pos - 1, 0, len(coords) - 1)]
+    hi = order[np.clip(pos, 0, len(coords) - 1)]
+    dlo = np.abs(coords[lo] - values)
+    dhi = np.abs(coords[hi] - values)
+    return np.where((dlo < dhi) | ((dlo == dhi) & (lo < hi)), lo, hi)   # first index of equal distances (argmin)
+
+
+#### RAY TABLE of one azimuth (same profile definition as in relshad)
+#### the profile of a cell in row i and column j is np.linspace(start, targ, nums); its latitudes only depend on the
+#### row and its longitudes only on the column, so for every row and column the table holds the number of profile
+#### points inside the DEM, the nearest grid row/column of every profile point (the end of the index profile) and
+#### the distances to the points, computed once per azimuth.
+#### output: dict with nums, nlat (lat), nlon (lon), yend (lat, nums), xend (lon, nums) (integers)
+####         and distance (lat, nums) in m
+def rayTable(lats,lons,sdirfn):
+
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    if lats[-1] < lats[0]:
+        lats = lats[::-1]    # the table always refers to increasing latitudes (see horizon)
+
+    rmax = ((np.linalg.norm(np.max(lats)-np.min(lats)))**2 + (np.linalg.norm(np.max(lons)-np.min(lons)))**2)**0.5  # define max. radius (that covers DEM area) in degrees lat/lon
+    nums = int(rmax * len(lats) / (lats[-1] - lats[0]))  # number of points for similar resolution as input (e.g. 200 m)
+
+    ##### calculate direction to sun
+    beta = math.radians(90-sdirfn)  # beta = 90-sdirfn
+    dy = math.sin(beta)*rmax    # walk into sun direction (y) as far as rmax
+    dx = math.cos(beta)*rmax    # walk into sun direction (x) as far as rmax
+
+    ##### POINTS ALONG THE PROFILES (rows: latitudes, columns: longitudes)
+    lat_list = np.linspace(lats, lats + dy, nums, axis=1)   # (lat, nums)
+    lon_list = np.linspace(lons, lons + dx, nums, axis=1)   # (lon, nums)
+
+    ## don't walk outside DEM boundaries (the start is inside, so the points inside are the first ones)
+    nlat = np.sum((lat_list < max(lats)) & (lat_list > min(lats)), axis=1)
+    nlon = np.sum((lon_list < max(lons)) & (lon_list > min(lons)), axis=1)
+
+    ## closest gridpoint of every profile point
+    yend = nearestIndex(lats, lat_list)
+    xend = nearestIndex(lons, lon_list)
+
+    ##### DISTANCE along profile (only depends on the latitude of the start point)
+    distance = haversineVec(lats[:, None], 0.0, lat_list, np.linspace(0.0, dx, nums)[None, :])
+
+    return dict(nums=nums, nlat=nlat, nlon=nlon, yend=yend, xend=xend, distance=distance)
+
+
+#### HORIZON ANGLE FUNCTION (vectorized)
+#### same profiles as in relshad: a glacier cell walks n = min(nlat, nlon) points towards the sun, the index profile
+#### is np.round(np.linspace(start, end, n)) with the end at the grid point closest to the last point inside the DEM.
+#### The cells with the same n are processed together: the index profiles of all of them are one np.linspace and the
+#### terrain along them one gather of the DEM, so there is no trigonometry and no loop over cells. The maximum of
+#### the slopes dz/d is taken first and turned into an angle once at the end (arctan is monotonic); the result is
+#### the Hmax of relshad up to round-off of the distances.
+#### A DEM with decreasing lats (row1 = north boundary) is flipped to increasing lats and back, so both orientations
+#### give the same Hmax (the rounding of the index profiles is not symmetric).
+#### table: ray table of sdirfn (see rayTable), None: computed here; it can be reused for other DEMs on the same grid
+#### output: Hmax (deg), maximum terrain angle towards sdirfn for glacier cells (0 elsewhere, as in relshad)
+def horizon(dem,mask,lats,lons,sdirfn,table=None):
+
+    lats = np.asarray(lats, dtype=float)
+    if lats[-1] < lats[0]:
+        return horizon(np.asarray(dem)[::-1],np.asarray(mask)[::-1],lats[::-1],lons,sdirfn,table)[::-1]
+
+    #### map features
+    z = np.asarray(dem, dtype=float)
+    ny, nx = np.shape(z)
+    tanH = np.full((ny, nx), -np.inf)   # lowest possible horizon (-90 deg)
+
+    if table is None:
+        table = rayTable(lats,lons,sdirfn)
+
+    #### only glacier cells that are not on the DEM border
+    inner = np.zeros((ny, nx), dtype=bool)
+    inner[1:-1, 1:-1] = True
+    glac = inner & (np.asarray(mask) == 1)
+    I, J = np.nonzero(glac)
+
+    ##### PROFILES of all cells with the same number of points
+    n_cell = np.minimum(table['nlat'][I], table['nlon'][J])
+    for n in np.unique(n_cell):
+        if n < 2:
+            continue     # no point along the profile inside the DEM
+        sel = (n_cell == n)
+        i, j = I[sel], J[sel]
+
+        ## index profiles (n, cells) to the closest gridpoint of the last point inside the DEM
+        y_list = np.round(np.linspace(i, table['yend'][i, n-1], n)).astype(int)
+        x_list = np.round(np.linspace(j, table['xend'][j, n-1], n)).astype(int)
+
+        #### get topography slope
+        zi = z[y_list, x_list]
+        slope = (zi[1:] - zi[0]) / table['distance'][i, 1:n].T
+        tanH[i, j] = slope.max(axis=0)
+
+    Hmax = np.degrees(np.arctan(tanH))
+    Hmax[~glac] = 0.0
+
+    return Hmax
+
+
+#### ILLUMINATION FROM HORIZON ANGLES
+#### the horizon only depends on the direction, so Hmax can be computed once per azimuth and
+#### thresholded for any number of solar elevations
+#### solh: solar elevation (deg), scalar or list/array -> output illu with shape (len(solh), lat, lon)
+def illuFromHorizon(Hmax,mask,solh):
+
+    glac = np.zeros(np.shape(Hmax), dtype=bool)
+    glac[1:-1, 1:-1] = (np.asarray(mask)[1:-1, 1:-1] == 1)   # glacier cells that are not on the DEM border
+
+    sh = np.asarray(solh, dtype=float)
+    sh_b = sh.reshape(sh.shape + (1, 1))   # broadcast elevations against the grid
+
+    illu = np.where(Hmax > sh_b, 0.0, 1.0)
+    illu[..., ~glac] = np.nan
+
+    return illu
+
+
+#### RELIEF SHADING FUNCTION (vectorized)
+#### drop-in replacement for relshad, returns the same (illu, Hmax) pair
+def relshadVec(dem,mask,lats,lons,solh,sdirfn):
+
+    Hmax = horizon(dem,mask,lats,lons,sdirfn)
+    illu = illuFromHorizon(Hmax,mask,solh)
+
+    return (illu,Hmax)
+
+
+#### RELIEF SHADING FOR SEVERAL SOLAR ELEVATIONS
+#### horizon is computed once and reused for all elevations in solhs
+#### output: illu with shape (len(solhs), lat, lon) and Hmax
+def relshadMulti(dem,mask,lats,lons,solhs,sdirfn):
+
+    Hmax = horizon(dem,mask,lats,lons,sdirfn)
+    illu = illuFromHorizon(Hmax,mask,np.atleast_1d(solhs))
+
+    return (illu,Hmax)
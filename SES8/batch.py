@@ -0,0 +1,385 @@
+#### Batch runs of the SEB and PDD models for many glaciers
+#### The glaciers are given as domain files (like Bell_dom.nc) or as polygons of a shapefile (like
+#### ../SES6/shp/BEL_GLA.shp) that are rasterized on a regional DEM (HGT, SLOPE, ASPECT, lat, lon): every polygon
+#### becomes a domain that covers the glacier plus a border of pad cells, with MASK = 1 where the cell centre is
+#### inside the polygon (as gdalwarp -cutline in SES6).
+#### Everything the glaciers share is loaded once and sent to the workers: the ERA5 data (T2 and RRR are downscaled
+#### on every glacier with the lapse rates, see forcing.py), the shortwave radiation and solar position of every ERA5
+#### cell (one solar table per cell, solpos.solarTable with reduce=True), the wind and the look-up table of the
+#### sky-view factors. Alternatively the forcing is taken from a model input file of the whole region.
+#### The glaciers run on a pool of processes, the largest first, so the small ones fill the gaps at the end.
+#### The result is one table with the glacier-wide SMB of every glacier (annual and total) and optionally the
+#### grids of every glacier.
+####
+#### usage:  python batch.py pdd --domains ./dom/*_dom.nc --era5 ../SES7/data/ERA5_bell.nc --table ./output/smb.csv
+####         python batch.py seb --shp ../SES6/shp/BEL_GLA.shp --dem ./data/region_dom.nc --era5 ../SES7/data/ERA5_bell.nc
+####                 --svf ./SVF/LUT_SVFdir45.nc --wind ./data/wind_data.nc --table ./output/smb.csv --grids ./output/grids
+########################################################################################################################
+
+#### import required packages
+import os
+import sys
+import glob
+import argparse
+import warnings
+import concurrent.futures
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SEB'))
+from PDD_dt import run_pdd
+from SEB_main_SD import run_seb
+from SEB_IO_SD import load_svf, load_wind
+from inputG import radiationChunks
+from solpos import solarTable
+
+try:
+    import geopandas as gpd   # only needed for shapefiles
+    HAVE_GEOPANDAS = True
+except ImportError:
+    HAVE_GEOPANDAS = False
+
+#### default settings
+PAD = 2                  # cells around the glacier in the domains of the shapefile polygons
+TIMEZONE_LON = -90.0     # longitude of the standard meridian (as in inputG.buildG)
+ZENI_THLD = 85.0         # zenith threshold of the radiation correction (as in inputG.buildG)
+R_EARTH = 6371000.0      # radius of the earth (m), for the glacier area
+
+#### SMB variable of the models (m w.e. per time step)
+SMB_VAR = dict(seb='smb', pdd='SMB')
+
+#### data shared with the workers (set by _initWorker)
+_shared = {}
+
+
+########################################################################################################################
+#### DOMAINS
+########################################################################################################################
+
+#### glacier mask of polygons on a lat/lon grid: 1 where the cell centre is inside (even-odd rule, holes are rings too)
+#### rings: list of (n, 2) arrays of (lon, lat) vertices
+def polygonMask(rings, lats, lons):
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    inside = np.zeros((len(lats), len(lons)), dtype=bool)
+    for ring in rings:
+        ring = np.asarray(ring, dtype=float)
+        x0, y0 = ring[:, 0], ring[:, 1]
+        x1, y1 = np.roll(x0, -1), np.roll(y0, -1)          # edges to the next vertex (closed ring)
+        for i, lat in enumerate(lats):
+            ## edges that cross the row and the longitude where they cross it
+            cross = (y0 > lat) != (y1 > lat)
+            xc = np.sort(x0[cross] + (lat - y0[cross]) * (x1[cross] - x0[cross]) / (y1[cross] - y0[cross]))
+            ## odd number of crossings east of the cell centre: inside
+            inside[i] ^= ((len(xc) - np.searchsorted(xc, lons, side='right')) % 2 == 1)
+    return inside.astype(np.int8)
+
+
+#### polygons of a shapefile: list of (name, rings) with rings in lon/lat
+#### name_field: attribute with the glacier names (None: <file>_<number>)
+def readPolygons(shpfile, name_field=None):
+    if not HAVE_GEOPANDAS:
+        raise ImportError('geopandas is needed to read shapefiles (or give the glaciers as domain files)')
+    gdf = gpd.read_file(shpfile)
+    if gdf.crs is not None and not gdf.crs.is_geographic:
+        gdf = gdf.to_crs(4326)
+    base = os.path.splitext(os.path.basename(shpfile))[0]
+    polygons = []
+    for i, (idx, row) in enumerate(gdf.iterrows()):
+        geom = row.geometry
+        if geom is None or geom.is_empty:
+            continue
+        parts = geom.geoms if geom.geom_type == 'MultiPolygon' else [geom]
+        rings = [np.asarray(ring.coords)[:, :2] for part in parts for ring in [part.exterior, *part.interiors]]
+        name = str(row[name_field]) if name_field is not None else '%s_%d' % (base, i)
+        polygons.append((name, rings))
+    return polygons
+
+
+#### domains of the polygons of a shapefile on a regional DEM (file or Dataset with HGT, SLOPE, ASPECT, lat, lon)
+#### output: list of (name, domain Dataset), polygons without cell centre on the DEM are skipped
+def shapeDomains(shpfile, dem, name_field=None, pad=PAD):
+    dem = dem if isinstance(dem, xr.Dataset) else xr.open_dataset(dem)
+    lats = np.asarray(dem.lat)
+    lons = np.asarray(dem.lon)
+    static = [name for name in dem.data_vars if dem[name].dims == ('lat', 'lon') and name != 'MASK']
+
+    domains = []
+    for name, rings in readPolygons(shpfile, name_field):
+        ## only the cells within the bounding box of the polygon are tested
+        vertices = np.concatenate(rings)
+        iy = np.flatnonzero((lats >= vertices[:, 1].min()) & (lats <= vertices[:, 1].max()))
+        ix = np.flatnonzero((lons >= vertices[:, 0].min()) & (lons <= vertices[:, 0].max()))
+        if len(iy) == 0 or len(ix) == 0:
+            print('%s: no cells on the DEM, skipped' % name)
+            continue
+        mask = np.zeros((len(lats), len(lons)), dtype=np.int8)
+        mask[iy[0]:iy[-1]+1, ix[0]:ix[-1]+1] = polygonMask(rings, lats[iy[0]:iy[-1]+1], lons[ix[0]:ix[-1]+1])
+        if not mask.any():
+            print('%s: no cells on the DEM, skipped' % name)
+            continue
+
+        ## glacier plus pad cells
+        rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+        ys = slice(max(rows[0] - pad, 0), min(rows[-1] + 1 + pad, len(lats)))
+        xs = slice(max(cols[0] - pad, 0), min(cols[-1] + 1 + pad, len(lons)))
+        ds = dem[static].isel(lat=ys, lon=xs).load()
+        ds['MASK'] = (('lat', 'lon'), mask[ys, xs], dict(long_name='Glacier mask'))
+        domains.append((name, ds))
+    return domains
+
+
+#### domains of domain files (name: file name without _dom.nc)
+def fileDomains(files):
+    if isinstance(files, str):
+        files = sorted(glob.glob(files))
+    domains = []
+    for f in files:
+        with xr.open_dataset(f) as ds:
+            domains.append((os.path.basename(f).replace('_dom.nc', '').replace('.nc', ''), ds.load()))
+    return domains
+
+
+#### indices of the coordinates dst in src (ValueError if a coordinate is missing)
+def gridIndex(src, dst):
+    src = np.asarray(src, dtype=float)
+    dst = np.asarray(dst, dtype=float)
+    idx = np.abs(src[None, :] - dst[:, None]).argmin(axis=1)
+    step = np.min(np.abs(np.diff(src))) if len(src) > 1 else 1.0
+    if np.any(np.abs(src[idx] - dst) > 0.01 * step):
+        raise ValueError('the glacier grid is not part of the grid of the forcing / look-up table')
+    return idx
+
+
+########################################################################################################################
+#### ONE GLACIER (worker)
+########################################################################################################################
+
+def _initWorker(shared):
+    _shared.clear()
+    _shared.update(shared)
+
+
+#### model input of one glacier: G from the solar table and radiation of its ERA5 cell (T2 and RRR are downscaled
+#### during the run), or the part of the regional input file
+def glacierForcing(dom, cell):
+    lats = np.asarray(dom.lat)
+    lons = np.asarray(dom.lon)
+    if _shared['forcing'] is not None:
+        if 'forcing_ds' not in _shared:
+            _shared['forcing_ds'] = xr.open_dataset(_shared['forcing'])   # opened once per worker
+        ds = _shared['forcing_ds']
+        sub = ds.isel(lat=gridIndex(ds.lat, lats), lon=gridIndex(ds.lon, lons))
+        return sub.assign(MASK=(('lat', 'lon'), np.asarray(dom.MASK)), HGT=(('lat', 'lon'), np.asarray(dom.HGT)))
+
+    time = _shared['time']
+    forcing = xr.Dataset(dict(HGT=(('lat', 'lon'), np.asarray(dom.HGT)), MASK=(('lat', 'lon'), np.asarray(dom.MASK))),
+                         coords=dict(time=time, lat=lats, lon=lons))
+    if _shared['model'] == 'seb':
+        tab, sw = _shared['solar'][cell]
+        mask = np.asarray(dom.MASK)
+        aspect = np.asarray(dom.ASPECT) - 180.0                   # south==0, east==negative, west==positive
+        if tab is None:
+            tab = solarTable(lats, lons, _shared['timezone_lon'], time)   # solar position of every cell
+        G = np.concatenate([G for sl, G in radiationChunks(time, lats, lons, np.asarray(dom.SLOPE), aspect, mask, sw,
+                                                           _shared['timezone_lon'], _shared['zeni_thld'], tab=tab)])
+        forcing['G'] = (('time', 'lat', 'lon'), G, dict(units='W m⁻²', long_name='Incoming shortwave radiation'))
+    return forcing
+
+
+#### glacier-wide values of one glacier: size, altitude and SMB (m w.e.) per year and of the whole period
+#### the SMB is the mean of the cells with values (e.g. the look-up table of the region can be nan on cells that are
+#### glacier only in the shapefile); valid_cells counts the cells with values at all simulated time steps
+def glacierSummary(name, dom, out, model):
+    mask = np.asarray(dom.MASK) != 0
+    lats = np.asarray(dom.lat)
+    lons = np.asarray(dom.lon)
+    hgt = np.asarray(dom.HGT)[mask]
+    dlat = np.radians(np.abs(np.diff(lats)).mean()) if len(lats) > 1 else np.nan
+    dlon = np.radians(np.abs(np.diff(lons)).mean()) if len(lons) > 1 else np.nan
+    area = (R_EARTH**2 * dlat * dlon * np.cos(np.radians(lats))[:, None] * np.ones(mask.shape))[mask].sum()
+
+    cells = np.asarray(out[SMB_VAR[model]])[:, mask]
+    valid = int(np.isfinite(cells[:-1]).all(axis=0).sum())     # the last time step of a run is not simulated
+    if valid < mask.sum():
+        warnings.warn('%s: %d of %d glacier cells without SMB, the glacier-wide SMB is the mean of the others'
+                      % (name, mask.sum() - valid, mask.sum()))
+    count = np.isfinite(cells).sum(axis=1)
+    smb = np.where(count > 0, np.nansum(cells, axis=1) / np.maximum(count, 1), 0.0)   # glacier-wide SMB per time step
+    year = pd.DatetimeIndex(np.asarray(out.time)).year
+    years, iy = np.unique(year, return_inverse=True)
+    annual = np.zeros(len(years))
+    np.add.at(annual, iy, smb)
+
+    row = dict(glacier=name, ncells=int(mask.sum()), valid_cells=valid, area_km2=area / 1e6,
+               hgt_min=hgt.min(), hgt_mean=hgt.mean(), hgt_max=hgt.max())
+    row.update({'smb_%d' % y: a for y, a in zip(years, annual)})
+    row['smb_total'] = annual.sum()
+    return row
+
+
+#### run the model on one glacier, returns the row of the table (the grids are written by the worker)
+def runGlacier(name, dom, cell):
+    model = _shared['model']
+    forcing = glacierForcing(dom, cell)
+    era5 = _shared['era5'] if _shared['forcing'] is None else None
+    if model == 'seb':
+        svf = _shared['svf']
+        if isinstance(svf, str):
+            svf = load_svf(svf.format(name=name))                 # look-up table of every glacier
+        else:
+            svf = svf.isel(lat=gridIndex(svf.lat, dom.lat), lon=gridIndex(svf.lon, dom.lon))
+        out = run_seb(forcing, None, svf, _shared['wind'], _shared['params'], verbose=False, era5=era5)
+    else:
+        out = run_pdd(forcing, None, _shared['params'], verbose=False, era5=era5)
+
+    if _shared['grids'] is not None:
+        out.to_netcdf(os.path.join(_shared['grids'], '%s_SMB_%s.nc' % (name, model.upper())),
+                      encoding={v: dict(zlib=True, dtype='f4') for v in out.data_vars if 'time' in out[v].dims})
+    return glacierSummary(name, dom, out, model)
+
+
+########################################################################################################################
+#### BATCH RUN
+########################################################################################################################
+
+#### model: 'seb' or 'pdd'; glaciers: list of (name, domain Dataset) (see shapeDomains, fileDomains) or domain files
+#### era5: ERA5 file or Dataset (t2m, tp, z, ssrd for the SEB) shared by the glaciers
+#### forcing: model input file of the whole region (T2, RRR, G for the SEB) instead of era5
+#### svf_lut: look-up table of the sky-view factors of the region (file or DataArray) or file name with {name} (SEB)
+#### wind: wind direction and speed, see run_seb (SEB); params: settings that differ from the defaults of the model
+#### reduce: True: one solar table per ERA5 cell (shared), False: solar position of every cell of every glacier
+#### workers: number of processes (None: all cores, 1: no pool); table: file of the table (csv); grids: folder for
+#### the grids of every glacier (None: no grids)
+#### output: DataFrame with one row per glacier
+def run_batch(model, glaciers, era5=None, forcing=None, svf_lut=None, wind=None, params=None, reduce=True,
+              workers=None, table=None, grids=None, timezone_lon=TIMEZONE_LON, zeni_thld=ZENI_THLD):
+
+    if model not in SMB_VAR:
+        raise ValueError("model must be 'seb' or 'pdd', got %r" % model)
+    if (era5 is None) == (forcing is None):
+        raise ValueError('give either era5 or forcing')
+    if isinstance(glaciers, str) or (len(glaciers) > 0 and isinstance(glaciers[0], str)):
+        glaciers = fileDomains(glaciers)
+    if len(glaciers) == 0:
+        raise ValueError('no glaciers')
+    if grids is not None:
+        os.makedirs(grids, exist_ok=True)
+
+    shared = dict(model=model, params=params, forcing=forcing, era5=None, grids=grids,
+                  timezone_lon=timezone_lon, zeni_thld=zeni_thld, solar={})
+    cells = [None] * len(glaciers)
+
+    if era5 is not None:
+        ## ERA5 read once (all glaciers of the region are in the same few cells)
+        ds = era5 if isinstance(era5, xr.Dataset) else xr.open_dataset(era5)
+        if 'valid_time' in ds.dims:
+            ds = ds.rename(valid_time='time')
+        ds = ds[[v for v in ['t2m', 'tp', 'z', 'ssrd'] if v in ds.data_vars]].load()
+        shared['era5'] = ds
+        time = np.asarray(ds.time)
+        elat = np.asarray(ds.latitude)
+        elon = np.asarray(ds.longitude)
+
+        ## ERA5 cell of every glacier (nearest to the centre of its glacier cells)
+        for n, (name, dom) in enumerate(glaciers):
+            mask = np.asarray(dom.MASK) != 0
+            lat_c = np.mean(np.asarray(dom.lat)[mask.any(axis=1)])
+            lon_c = np.mean(np.asarray(dom.lon)[mask.any(axis=0)])
+            cells[n] = (int(np.abs(elat - lat_c).argmin()), int(np.abs(elon - lon_c).argmin()))
+
+        ## shortwave radiation and solar position of every ERA5 cell, shared by its glaciers
+        if model == 'seb':
+            for cell in sorted(set(cells)):
+                tab = solarTable([elat[cell[0]]], [elon[cell[1]]], timezone_lon, time, reduce=True) if reduce else None
+                shared['solar'][cell] = (tab, np.asarray(ds.ssrd[:, cell[0], cell[1]]) / 3600)   # J/m2 -> W/m2
+    else:
+        with xr.open_dataset(forcing) as ds:
+            time = np.asarray(ds.time)
+    shared['time'] = time
+
+    if model == 'seb':
+        svf = load_svf(svf_lut) if svf_lut is not None and '{name}' not in str(svf_lut) else svf_lut
+        shared['svf'] = svf if svf is not None else load_svf()
+        shared['wind'] = load_wind(wind, time) if wind is not None else load_wind(time=time)   # read once
+
+    ## largest glaciers first: the pool hands the small ones to the workers that finish early
+    order = sorted(range(len(glaciers)), key=lambda n: -int(np.sum(np.asarray(glaciers[n][1].MASK) != 0)))
+    print('%d glaciers, %d glacier cells' % (len(glaciers), sum(int(np.sum(np.asarray(d.MASK) != 0)) for _, d in glaciers)))
+
+    rows = {}
+    if workers == 1:
+        _initWorker(shared)
+        for n in order:
+            rows[n] = runGlacier(glaciers[n][0], glaciers[n][1], cells[n])
+            print('%s finished (%d/%d)' % (glaciers[n][0], len(rows), len(glaciers)))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_initWorker,
+                                                    initargs=(shared,)) as pool:
+            futures = {pool.submit(runGlacier, glaciers[n][0], glaciers[n][1], cells[n]): n for n in order}
+            for f in concurrent.futures.as_completed(futures):
+                rows[futures[f]] = f.result()
+                print('%s finished (%d/%d)' % (glaciers[futures[f]][0], len(rows), len(glaciers)))
+
+    df = pd.DataFrame([rows[n] for n in range(len(glaciers))]).set_index('glacier')
+    if era5 is not None:
+        df['era5_lat'] = [elat[c[0]] for c in cells]
+        df['era5_lon'] = [elon[c[1]] for c in cells]
+    if table is not None:
+        df.to_csv(table)
+    return df
+
+
+########################################################################################################################
+#### COMMAND LINE
+########################################################################################################################
+
+if __name__ == '__main__':
+    import ast
+
+    parser = argparse.ArgumentParser(description='SEB or PDD model for many glaciers')
+    parser.add_argument('model', choices=['seb', 'pdd'])
+    parser.add_argument('--domains', nargs='*', default=None, help='domain files (HGT, MASK, SLOPE, ASPECT)')
+    parser.add_argument('--shp', default=None, help='shapefile with the glacier polygons (instead of --domains)')
+    parser.add_argument('--dem', default=None, help='regional DEM (HGT, SLOPE, ASPECT, lat, lon) for --shp')
+    parser.add_argument('--name-field', default=None, help='attribute of the shapefile with the glacier names')
+    parser.add_argument('--pad', type=int, default=PAD, help='cells around the glaciers of --shp')
+    parser.add_argument('--save-domains', default=None, help='folder to write the domains of --shp to')
+    parser.add_argument('--era5', default=None, help='ERA5 file (t2m, tp, z, ssrd)')
+    parser.add_argument('--input', default=None, help='model input file of the region (instead of --era5)')
+    parser.add_argument('--svf', default='./SVF/LUT_SVFdir45.nc',
+                        help='look-up table of directed sky-view factors of the region, or file name with {name} (SEB)')
+    parser.add_argument('--wind', default='./data/wind_data.nc', help='wind direction and speed (SEB)')
+    parser.add_argument('--no-reduce', action='store_true', help='solar position of every cell instead of every ERA5 cell')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all cores)')
+    parser.add_argument('--table', default='./output/SMB_glaciers.csv', help='table with the SMB of every glacier')
+    parser.add_argument('--grids', default=None, help='folder for the grids of every glacier')
+    parser.add_argument('--set', nargs='*', default=[], metavar='NAME=VALUE',
+                        help='settings that differ from the defaults of the model, e.g. --set c1=25')
+    args = parser.parse_args()
+
+    params = {}
+    for item in args.set:
+        name, value = item.split('=', 1)
+        try:
+            params[name] = ast.literal_eval(value)   # numbers, True/False, None
+        except (ValueError, SyntaxError):
+            params[name] = value                     # strings (e.g. backend=numba)
+
+    if args.shp is not None:
+        if args.dem is None:
+            parser.error('--shp needs --dem')
+        glaciers = shapeDomains(args.shp, args.dem, args.name_field, args.pad)
+        if args.save_domains is not None:
+            os.makedirs(args.save_domains, exist_ok=True)
+            for name, dom in glaciers:
+                dom.to_netcdf(os.path.join(args.save_domains, '%s_dom.nc' % name))
+    elif args.domains:
+        glaciers = fileDomains(args.domains)
+    else:
+        parser.error('give the glaciers with --domains or --shp')
+
+    run_batch(args.model, glaciers, args.era5, args.input, args.svf if args.model == 'seb' else None,
+              args.wind if args.model == 'seb' else None, params, not args.no_reduce, args.workers, args.table,
+              args.grids)
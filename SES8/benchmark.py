@@ -0,0 +1,307 @@
+#### Benchmark of the processing chain on synthetic domains
+#### A synthetic DEM (a gaussian mountain with noise), glacier mask, slope/aspect and forcing (T2, RRR, shortwave
+#### radiation, wind) are created for several grid sizes and record lengths. The stages of the chain are timed
+#### one by one with the same functions the scripts use:
+####    relshad ........ horizon and relief shading for one direction (relshadFunct_SD.relshadVec), checked against the flipped DEM
+####    relshad_loop ... the original relshad loop (only if selected with --stages, slow for large grids)
+####    lut ............ look-up table of directed sky-view factors (LUT_SVFdir45.buildLUT, one process)
+####    radiation ...... corrected radiation over the whole cube (inputG.radiationChunks)
+####    pdd.* .......... PDD model: read, model, write
+####    seb.* .......... SEB model: read, snowdrift, albedo, timeloop, write
+#### For every stage the wall time (best of --repeat runs) and the peak memory allocated during the stage
+#### (tracemalloc, numpy arrays included) are recorded, printed as a table and written to a json file,
+#### so the numbers of different versions of the code can be compared.
+####
+#### usage:  python benchmark.py --sizes 50 100 200 --years 1 4 --out ./output/benchmark.json
+########################################################################################################################
+
+#### import required packages
+import os
+import sys
+import gc
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SEB'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SVF'))
+from domain import Domain
+from ncstream import createNC
+from outwriter import OutputWriter
+from inputG import radiationChunks
+from relshadFunct_SD import relshad, relshadVec, horizon
+from LUT_SVFdir45 import buildLUT
+from PDD_dt import pdd_cells
+import PDD_dt
+from SEB_IO_SD import open_forcing, read_forcing, load_svf
+from SEB_param_SD import get_params
+from SEB_preproc_SD import altitude_scaling, svf_table, deposition_factor, wind_sectors, snowdrift, tacc_daily, albedo_snow
+from SEB_kernel_SD import seb_timeloop
+from SEB_main_SD import OUTPUT_VARS
+
+#### synthetic domain: spacing and corner of the grid (about the size of the cells of the Bell domain)
+DLAT = 0.002
+DLON = 0.004
+LAT0 = -62.2
+LON0 = -58.95
+DT = 6                     # time step of the synthetic forcing (hours)
+
+
+########################################################################################################################
+#### SYNTHETIC INPUT
+########################################################################################################################
+
+#### domain with n x n cells: HGT, MASK, SLOPE, ASPECT (north==0) as Dataset
+def syntheticDomain(n, seed=0):
+    rng = np.random.default_rng(seed)
+    lats = LAT0 + DLAT * np.arange(n)
+    lons = LON0 + DLON * np.arange(n)
+    y, x = np.meshgrid(np.linspace(-1, 1, n), np.linspace(-1, 1, n), indexing='ij')
+
+    HGT = 900 * np.exp(-2 * (x**2 + y**2)) + 300 * np.exp(-8 * ((x - 0.5)**2 + (y + 0.4)**2))
+    HGT = HGT + 15 * rng.standard_normal((n, n))
+    HGT[HGT < 0] = 0.0
+    MASK = (HGT > 250).astype(float)
+
+    ## slope and aspect from the gradient (metres per cell)
+    dy = DLAT * 111000.0
+    dx = DLON * 111000.0 * np.cos(np.radians(LAT0))
+    gy, gx = np.gradient(HGT, dy, dx)
+    SLOPE = np.degrees(np.arctan(np.hypot(gx, gy)))
+    ASPECT = np.degrees(np.arctan2(-gx, -gy)) % 360        # downslope direction, north==0 (lat increases northwards)
+
+    return xr.Dataset(
+        data_vars=dict(HGT=(['lat', 'lon'], HGT, dict(units='m')),
+                       MASK=(['lat', 'lon'], MASK),
+                       SLOPE=(['lat', 'lon'], SLOPE, dict(units='deg')),
+                       ASPECT=(['lat', 'lon'], ASPECT, dict(units='deg'))),
+        coords=dict(lat=(['lat'], lats), lon=(['lon'], lons)))
+
+
+#### forcing of one grid point for the given number of years: T2 (K), RRR (mm), SW (W m**-2), DIR (deg), WS (m/s)
+def syntheticForcing(years, seed=0):
+    rng = np.random.default_rng(seed)
+    time = pd.date_range('2010-01-01', periods=int(years * 365 * 24 / DT), freq='%dh' % DT)
+    doy = np.asarray(time.dayofyear, dtype=float)
+    hour = np.asarray(time.hour, dtype=float)
+
+    T2 = 273.15 - 2.0 + 4.0 * np.cos(2 * np.pi * (doy - 15) / 365) + 2.0 * np.sin(2 * np.pi * (hour - 9) / 24)
+    T2 = T2 + rng.standard_normal(len(time))
+    RRR = rng.gamma(0.4, 2.0, len(time)) * (rng.random(len(time)) < 0.5)
+    SW = np.maximum(0.0, 600 * np.sin(np.pi * (hour - 6) / 12)) * (0.6 + 0.4 * np.cos(2 * np.pi * (doy - 15) / 365))
+    DIR = rng.uniform(0, 360, len(time))
+    WS = rng.gamma(2.0, 3.0, len(time))
+
+    return np.asarray(time), T2, RRR, SW, DIR, WS
+
+
+#### forcing cube (time, lat, lon): T2 with a lapse rate of -6.5 K/km, RRR constant in space
+def forcingCube(dom, T2, RRR):
+    HGT = np.asarray(dom.HGT)
+    T2 = T2[:, None, None] - 0.0065 * HGT
+    RRR = np.broadcast_to(RRR[:, None, None], T2.shape)
+    return T2, RRR
+
+
+########################################################################################################################
+#### MEASUREMENT
+########################################################################################################################
+
+#### run fn(*args) repeat times: best wall time (s) and peak memory (MB) of the first run, returns the result
+def measure(records, stage, info, repeat, memory, fn, *args, **kwargs):
+    best = np.inf
+    peak = None
+    for r in range(repeat):
+        gc.collect()
+        if memory and r == 0:
+            tracemalloc.start()
+        t = time.perf_counter()
+        result = fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - t)
+        if memory and r == 0:
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+    records.append(dict(stage=stage, seconds=best, peak_mb=peak, **info))
+    return result
+
+
+#### check (not timed): the same DEM with decreasing latitudes (rows from north to south) gives the same horizon
+def checkFlip(Hmax, dem, mask, lats, lons, sdirfn):
+    Hflip = horizon(dem[::-1], mask[::-1], lats[::-1], lons, sdirfn)[::-1]
+    if not np.array_equal(Hmax, Hflip):
+        raise RuntimeError('horizon of the flipped DEM differs in %d cells' % np.sum(Hmax != Hflip))
+
+
+#### print the records as a table
+def printTable(records):
+    print('%-16s %6s %6s %8s %8s %10s %10s' % ('stage', 'nlat', 'nlon', 'ncells', 'nt', 'time (s)', 'peak (MB)'))
+    for r in records:
+        peak = '%10.1f' % r['peak_mb'] if r['peak_mb'] is not None else '%10s' % '-'
+        print('%-16s %6d %6d %8d %8d %10.3f %s' % (r['stage'], r['nlat'], r['nlon'], r['ncells'], r['nt'],
+                                                   r['seconds'], peak))
+
+
+########################################################################################################################
+#### STAGES
+########################################################################################################################
+
+def consume(gen, out):
+    for sl, G in gen:
+        out[sl] = G
+    return out
+
+
+def seb_stages(records, info, repeat, memory, forcing, svf, DIR, WS, outfile, backend):
+    p = get_params(backend=backend)
+
+    ds = open_forcing(forcing)
+    dom = Domain(np.array(ds.MASK), np.array(ds.lat), np.array(ds.lon), p['dtype'])
+    E2 = altitude_scaling(ds.HGT, dom)
+    SVF_dirs, SVF = svf_table(svf, dom)
+    Ddir = deposition_factor(SVF, p['Dmax'])
+    isector = wind_sectors(DIR, SVF_dirs)
+
+    T2, G, Prec = measure(records, 'seb.read', info, repeat, memory, read_forcing, ds, slice(None), dom)
+    Snowcorr = measure(records, 'seb.snowdrift', info, repeat, memory,
+                       snowdrift, T2, Prec, WS, isector, E2, Ddir, p['temp_thresh'])
+
+    def albedo():
+        tacc_day = tacc_daily(T2, Snowcorr, np.zeros(dom.ncells, dom.dtype), p['st_p_day'])
+        return albedo_snow(tacc_day, p['p2'], p['st_p_day'], len(T2))
+    alb_s = measure(records, 'seb.albedo', info, repeat, memory, albedo)
+
+    res, state = measure(records, 'seb.timeloop', info, repeat, memory, seb_timeloop,
+                         Snowcorr, alb_s, G, T2, p['albedo_ice'], p['tau'], p['c1'], p['c0'], p['sec_per_hr'],
+                         p['dt'], p['lm'], p['rho_water'], p['backend'])
+
+    def write():
+        variables = {name: (attrs, how) for name, (i, attrs, how) in OUTPUT_VARS.items()}
+        with OutputWriter(outfile, np.array(ds.time), dom, variables, dtype=p['out_dtype'],
+                          zlib=p['out_zlib']) as writer:
+            writer.write(0, **{name: res[i] for name, (i, attrs, how) in OUTPUT_VARS.items()})
+    measure(records, 'seb.write', info, repeat, memory, write)
+    ds.close()
+
+
+def pdd_stages(records, info, repeat, memory, forcing, outfile, backend):
+    with xr.open_dataset(forcing) as ds:
+        dom = Domain(np.array(ds.MASK), np.array(ds.lat), np.array(ds.lon))
+
+        def read():
+            return dom.gather(ds.T2) - 273.15, dom.gather(ds.RRR)
+        Temp, Prec = measure(records, 'pdd.read', info, repeat, memory, read)
+
+        ACC, MELT, SMB = measure(records, 'pdd.model', info, repeat, memory, pdd_cells, Temp, Prec,
+                                 PDD_dt.dt, PDD_dt.M_thresh, PDD_dt.S_thresh, PDD_dt.DDFice, PDD_dt.DDFsnow, backend)
+
+        def write():
+            with OutputWriter(outfile, np.array(ds.time), dom, {name: ({'units': 'm w.e.'}, 'sum')
+                                                               for name in ['ACC', 'MELT', 'SMB']}) as writer:
+                writer.write(0, ACC=ACC / 1000, MELT=MELT / 1000, SMB=SMB / 1000)
+        measure(records, 'pdd.write', info, repeat, memory, write)
+
+
+########################################################################################################################
+#### BENCHMARK
+########################################################################################################################
+
+#### sizes: grid sizes n (n x n cells); years: record lengths (years of 6-hourly forcing)
+#### stages: stages to run (None: all except relshad_loop); repeat: number of runs per stage (best time is kept)
+#### memory: measure the peak memory (tracemalloc slows down code with many small Python objects)
+def run_benchmark(sizes=(50, 100), years=(1,), stages=None, repeat=1, memory=True, backend='numpy', workdir=None):
+
+    stages = set(stages or ['relshad', 'lut', 'radiation', 'pdd', 'seb'])
+    records = []
+
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for n in sizes:
+            dom = syntheticDomain(n)
+            MASK = np.array(dom.MASK)
+            lats, lons = np.array(dom.lat), np.array(dom.lon)
+            info = dict(nlat=n, nlon=n, ncells=int(np.sum(MASK == 1)), nt=0)
+
+            domfile = os.path.join(tmp, 'dom_%d.nc' % n)
+            dom.to_netcdf(domfile)
+
+            #### grid-only stages
+            if 'relshad' in stages:
+                illu, Hmax = measure(records, 'relshad', info, repeat, memory, relshadVec, np.array(dom.HGT), MASK, lats, lons, 10.0, 45.0)
+                checkFlip(Hmax, np.array(dom.HGT), MASK, lats, lons, 45.0)
+            if 'relshad_loop' in stages:
+                try:
+                    measure(records, 'relshad_loop', info, repeat, memory, relshad, np.array(dom.HGT), MASK, lats, lons, 10.0, 45.0)
+                except AttributeError as err:     # np.int of the original code (numpy >= 1.24)
+                    print('relshad_loop skipped: %s' % str(err).split('\n')[0])
+
+            lutfile = os.path.join(tmp, 'lut_%d.nc' % n)
+            if 'lut' in stages or 'seb' in stages:
+                measure(records, 'lut', info, 1, memory, buildLUT, domfile, lutfile, workers=1,
+                        cachedir=os.path.join(tmp, 'horizon_cache'), resume=False)
+
+            for nyears in years:
+                time_, T2, RRR, SW, DIR, WS = syntheticForcing(nyears)
+                info = dict(info, nt=len(time_))
+
+                #### radiation over the cube
+                G = np.empty((len(time_), n, n))
+                if stages & {'radiation', 'pdd', 'seb'}:
+                    measure(records, 'radiation', info, repeat, memory, lambda: consume(
+                        radiationChunks(time_, lats, lons, np.array(dom.SLOPE), np.array(dom.ASPECT) - 180.0, MASK, SW,
+                                        -90.0, 85.0), G))
+
+                if not stages & {'pdd', 'seb'}:
+                    continue
+
+                #### forcing file of the models (not timed)
+                T2c, RRRc = forcingCube(dom, T2, RRR)
+                forcing = os.path.join(tmp, 'forcing_%d_%d.nc' % (n, nyears))
+                nc = createNC(forcing, time_, lats, lons, dict(T2=dict(units='K'), RRR=dict(units='mm'), G=dict(units='W m-2')),
+                              static=dict(HGT=(np.array(dom.HGT), dict(units='m')), MASK=(MASK, dict())))
+                nc['T2'][:] = T2c
+                nc['RRR'][:] = RRRc
+                nc['G'][:] = G
+                nc.close()
+                del T2c, RRRc, G
+
+                if 'pdd' in stages:
+                    pdd_stages(records, info, repeat, memory, forcing, os.path.join(tmp, 'pdd_out.nc'), backend)
+                if 'seb' in stages:
+                    seb_stages(records, info, repeat, memory, forcing, load_svf(lutfile), DIR, WS,
+                               os.path.join(tmp, 'seb_out.nc'), backend)
+                os.remove(forcing)
+
+    return records
+
+
+########################################################################################################################
+#### COMMAND LINE
+########################################################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the processing chain on synthetic domains')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 100], help='grid sizes n (n x n cells)')
+    parser.add_argument('--years', type=float, nargs='+', default=[1], help='record lengths (years)')
+    parser.add_argument('--stages', nargs='+', default=None,
+                        choices=['relshad', 'relshad_loop', 'lut', 'radiation', 'pdd', 'seb'],
+                        help='stages to run (default: all except relshad_loop)')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='runs per stage, the best time is kept (e.g. 2 to exclude the numba compilation)')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure the peak memory')
+    parser.add_argument('--backend', default='numpy', help="time loops of the models: 'numpy' or 'numba'")
+    parser.add_argument('--out', default=None, help='json file for the results')
+    args = parser.parse_args()
+
+    records = run_benchmark(args.sizes, args.years, args.stages, args.repeat, not args.no_memory, args.backend)
+    printTable(records)
+
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(dict(python=platform.python_version(), numpy=np.__version__, machine=platform.machine(),
+                           date=time.strftime('%Y-%m-%d %H:%M:%S'), args=vars(args), records=records), f, indent=1)
+        print('results written to %s' % args.out)
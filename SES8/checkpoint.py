@@ -0,0 +1,57 @@
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+
+def writeCheckpoint(filename, model, time, dom, **state):
+    """ State of a model run on the glacier cells
+
+    filename ...... checkpoint file (NetCDF), replaced as a whole so that an interrupted write keeps the old one
+    model ......... name of the model ('seb', 'pdd')
+    time .......... time of the state: first time step that is not included in the state yet (datetime64)
+    dom ........... Domain of the glacier cells (see domain.py)
+    state ......... state variables (ncells), e.g. snow_depth=..., smb_cum=...
+    """
+    ds = xr.Dataset({name: (['cell'], np.asarray(values, dtype='f8')) for name, values in state.items()},
+                    coords=dict(cell=(['cell'], np.asarray(dom.index, dtype='i8'))))
+    ds.attrs['model'] = model
+    ds.attrs['time'] = str(np.datetime64(time, 's'))
+    ds.attrs['shape'] = np.asarray(dom.shape, dtype='i8')
+    tmp = filename + '.tmp'
+    ds.to_netcdf(tmp)
+    os.replace(tmp, filename)
+
+
+def readCheckpoint(filename, model, dom):
+    """ Time (datetime64) and state of a checkpoint, checked against the model and the glacier cells """
+    with xr.open_dataset(filename) as ds:
+        if ds.attrs.get('model') != model:
+            raise ValueError('%s is a checkpoint of the model %r, not %r' % (filename, ds.attrs.get('model'), model))
+        if (tuple(np.atleast_1d(ds.attrs['shape'])) != tuple(dom.shape)
+                or not np.array_equal(ds['cell'].values, dom.index)):
+            raise ValueError('the glacier cells of %s differ from the domain of the run' % filename)
+        state = {name: ds[name].values for name in ds.data_vars}
+        return np.datetime64(ds.attrs['time'], 'ns'), state
+
+
+def restartIndex(time, tstate):
+    """ Index of the time step tstate of a checkpoint in the time axis of the new forcing """
+    i = pd.DatetimeIndex(np.asarray(time)).get_indexer([pd.Timestamp(tstate)])[0]
+    if i < 0:
+        raise ValueError('the forcing (%s - %s) does not contain the time of the checkpoint %s'
+                         % (np.asarray(time)[0], np.asarray(time)[-1], tstate))
+    return i
+
+
+def checkpointSteps(nt, every, st_p_day):
+    """ Time steps (relative to the start of the run) at which a checkpoint is written
+
+    nt ............ number of time steps of the run
+    every ......... number of time steps between the checkpoints, None: only at the end of the run
+    st_p_day ...... time steps per day; the state is only complete at the end of a day (daily albedo age),
+                    so the last checkpoint is at the end of the run or of its last complete day
+    """
+    end = nt - nt % st_p_day
+    steps = list(range(every, end, every)) if every else []
+    return steps + [end] if end > 0 else steps
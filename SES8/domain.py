@@ -0,0 +1,52 @@
+import numpy as np
+import xarray as xr
+
+
+class Domain:
+    """ Glacier cells of a model domain
+
+    The models only need the cells inside the glacier mask. The inputs are gathered
+    to a compact (time, ncells) layout, the models run on it and the results are
+    scattered back to the (time, lat, lon) grid only for the output.
+
+    Inputs:
+
+        MASK            ::  glacier mask (lat, lon), glacier where MASK != 0
+        lats, lons      ::  coordinates of the domain (optional, for the output)
+        dtype           ::  data type of the gathered fields ('f8' or 'f4' to halve the memory)
+    """
+
+    def __init__(self, MASK, lats=None, lons=None, dtype='f8'):
+        self.mask = (np.asarray(MASK) != 0)
+        self.shape = self.mask.shape
+        self.index = np.flatnonzero(self.mask)   # glacier cells in the flattened grid (C order, same as field[:,mask])
+        self.ncells = len(self.index)
+        self.lats = None if lats is None else np.asarray(lats)
+        self.lons = None if lons is None else np.asarray(lons)
+        self.dtype = np.dtype(dtype)
+
+    def __repr__(self):
+        return 'Domain(%d of %d cells, %s)' % (self.ncells, self.mask.size, self.dtype)
+
+    def gather(self, field, dtype=None):
+        """ (..., lat, lon) -> (..., ncells), contiguous, with the data type of the domain """
+        field = np.asarray(field)
+        if field.shape[-2:] != self.shape:
+            raise ValueError('field with shape %s does not match the domain %s' % (field.shape, self.shape))
+        flat = field.reshape(field.shape[:-2] + (-1,))
+        return np.ascontiguousarray(flat[..., self.index], dtype=self.dtype if dtype is None else dtype)
+
+    def scatter(self, cells, fill=np.nan, dtype=None):
+        """ (..., ncells) -> (..., lat, lon), fill outside the glacier """
+        cells = np.asarray(cells)
+        if cells.shape[-1] != self.ncells:
+            raise ValueError('%d cells given, the domain has %d' % (cells.shape[-1], self.ncells))
+        out = np.full(cells.shape[:-1] + (self.mask.size,), fill, dtype=cells.dtype if dtype is None else dtype)
+        out[..., self.index] = cells
+        return out.reshape(cells.shape[:-1] + self.shape)
+
+
+def loadDomain(domfile, dtype='f8'):
+    """ Domain from a file with MASK, lat and lon (e.g. Bell_dom.nc or a model input file) """
+    with xr.open_dataset(domfile) as ds:
+        return Domain(np.array(ds.MASK), np.array(ds.lat), np.array(ds.lon), dtype)
@@ -0,0 +1,274 @@
+#### Parameter ensembles of the SEB and PDD models
+#### The forcing is read once and the preprocessing that does not depend on the varied parameters
+#### (snowdrift, daily aggregates) is shared by the members. The members of a batch run together in one
+#### time loop: their glacier cells are put side by side (member, ncells) -> (member * ncells), every cell
+#### with its own parameters. Batches can be spread over a pool of processes. The result is a compact summary
+#### (glacier-wide annual and total SMB per member) instead of full (time, lat, lon) fields.
+####
+#### usage (settings below):  python ensemble.py
+#### or from other scripts:
+####    from ensemble import param_grid, seb_ensemble, pdd_ensemble
+####    members = param_grid(c1=[20, 30, 40], c0=[-60, -40, -20])
+####    summary = seb_ensemble(T2, G, Prec, time, WS, isector, E2, SVF, members)
+########################################################################################################################
+
+#### import required packages
+import os
+import sys
+import warnings
+import itertools
+import concurrent.futures
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SEB'))
+import SEB_param_SD
+import PDD_dt
+from PDD_dt import pdd_cells
+from SEB_kernel_SD import seb_timeloop
+from SEB_preproc_SD import deposition_factor, snowdrift, tacc_daily, albedo_snow
+
+#### parameters that can be varied (default values from SEB_param_SD.py and PDD_dt.py)
+SEB_PARAMS = ['c1', 'c0', 'p2', 'temp_thresh', 'Dmax', 'albedo_ice', 'tau']
+PDD_PARAMS = ['DDFice', 'DDFsnow', 'S_thresh', 'M_thresh']
+
+#### data shared with the workers (set by _initWorker)
+_shared = {}
+
+
+########################################################################################################################
+#### HELPER FUNCTIONS
+########################################################################################################################
+
+#### all combinations of the given parameter values: dict name -> array (nmember)
+def param_grid(**values):
+    names = list(values)
+    combos = list(itertools.product(*[np.atleast_1d(values[n]) for n in names]))
+    return {n: np.array([c[i] for c in combos], dtype=float) for i, n in enumerate(names)}
+
+
+#### members as dict name -> array (nmember), parameters that are not given take the default value
+def _members(members, names, defaults):
+    unknown = [n for n in members if n not in names]
+    if unknown:
+        raise ValueError('parameters %s cannot be varied, use %s' % (unknown, names))
+    sizes = {len(np.atleast_1d(v)) for v in members.values()}
+    if len(sizes) > 1:
+        raise ValueError('all parameters need the same number of members, got %s' % sorted(sizes))
+    nmem = sizes.pop() if sizes else 1
+    return {n: np.broadcast_to(np.asarray(members.get(n, defaults[n]), dtype=float), (nmem,)).copy() for n in names}
+
+
+#### SMB of the cells (time, nmember, ncells) -> glacier-wide mean of the cells with values (time, nmember), nan where
+#### no cell has a value, and the number of cells of every member without SMB (nmember)
+def _cellMean(smb):
+    count = np.isfinite(smb).sum(axis=2)
+    mean = np.nansum(smb, axis=2) / np.where(count > 0, count, np.nan)
+    missing = (~np.isfinite(smb[:-1])).any(axis=0).sum(axis=1)     # the last time step of a run is not simulated
+    return mean, missing
+
+
+#### warn when the glacier-wide SMB of some members leaves out cells without SMB
+def _warnMissing(missing, ncells):
+    if missing.any():
+        warnings.warn('%d of %d members have glacier cells without SMB (up to %d of %d cells), their glacier-wide SMB '
+                      'is the mean of the others' % (np.sum(missing > 0), len(missing), missing.max(), ncells))
+
+
+#### glacier-wide mean SMB (time, nmember) -> summary dataset (annual and total SMB per member)
+#### time steps without SMB (nan) are left out of the sums
+def _summary(series, time, params):
+    year = pd.DatetimeIndex(np.asarray(time)).year
+    years, iy = np.unique(year, return_inverse=True)
+    annual = np.array([np.nansum(series[iy == k], axis=0) for k in range(len(years))])
+
+    ds = xr.Dataset(coords=dict(member=np.arange(series.shape[1]), year=years))
+    ds['smb_annual'] = (('member', 'year'), annual.T, dict(units='m w.e.', long_name='Glacier-wide annual surface mass balance'))
+    ds['smb_total'] = (('member',), annual.sum(axis=0), dict(units='m w.e.', long_name='Glacier-wide surface mass balance of the period'))
+    for name, values in params.items():
+        ds[name] = (('member',), values)
+    return ds
+
+
+#### run the batches (in this process or in a pool of processes)
+def _runBatches(func, batches, shared, workers):
+    if workers is None or workers == 1:
+        _initWorker(shared)
+        return [func(b) for b in batches]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_initWorker,
+                                                initargs=(shared,)) as pool:
+        return list(pool.map(func, batches))
+
+
+def _initWorker(shared):
+    _shared.clear()
+    _shared.update(shared)
+    _shared['cache'] = {}
+
+
+########################################################################################################################
+#### SEB ENSEMBLE
+########################################################################################################################
+
+#### snowfall and accumulated Tmax only depend on temp_thresh and Dmax: computed once per combination
+#### the members are sorted by (temp_thresh, Dmax), so only the current combination is kept (bounded memory)
+def _sebPreproc(temp_thresh, Dmax):
+    key = (temp_thresh, Dmax)
+    if key not in _shared['cache']:
+        _shared['cache'].clear()
+        f = _shared
+        Snowcorr = snowdrift(f['T2'], f['Prec'], f['WS'], f['isector'], f['E2'], deposition_factor(f['SVF'], Dmax), temp_thresh)
+        tacc_day = tacc_daily(f['T2'], Snowcorr, np.zeros(f['T2'].shape[1], f['T2'].dtype), f['st_p_day'])
+        _shared['cache'][key] = (Snowcorr, tacc_day)
+    return _shared['cache'][key]
+
+
+#### one batch of members: glacier-wide mean SMB (time, nbatch) and cells without SMB (nbatch)
+def _sebBatch(params):
+    f = _shared
+    nt, nc = f['T2'].shape
+    nb = len(params['c1'])
+
+    Snowcorr = np.empty((nt, nb * nc), f['T2'].dtype)
+    alb_s = np.empty((nt, nb * nc), f['T2'].dtype)
+    for m in range(nb):
+        cells = slice(m * nc, (m + 1) * nc)
+        Snowcorr_m, tacc_day = _sebPreproc(params['temp_thresh'][m], params['Dmax'][m])
+        Snowcorr[:, cells] = Snowcorr_m
+        alb_s[:, cells] = albedo_snow(tacc_day, params['p2'][m], f['st_p_day'], nt)
+
+    ## albedo_ice and tau are the same for all cells of the time loop: members with other values are run separately
+    series = np.zeros((nt, nb))
+    missing = np.zeros(nb, dtype=int)
+    for albedo_ice, tau in sorted(set(zip(params['albedo_ice'], params['tau']))):
+        sel = np.flatnonzero((params['albedo_ice'] == albedo_ice) & (params['tau'] == tau))
+        cols = (sel.reshape(-1, 1) * nc + np.arange(nc)).ravel()
+        res, state = seb_timeloop(Snowcorr[:, cols], alb_s[:, cols], np.tile(f['G'], (1, len(sel))),
+                                  np.tile(f['T2'], (1, len(sel))), albedo_ice, tau,
+                                  np.repeat(params['c1'][sel], nc), np.repeat(params['c0'][sel], nc),
+                                  f['sec_per_hr'], f['dt'], f['lm'], f['rho_water'], f['backend'])
+        series[:, sel], missing[sel] = _cellMean(res[4].reshape(nt, len(sel), nc))
+
+    return series, missing
+
+
+#### T2 (°C), G (W m**-2), Prec (m): (time, ncells) on the glacier cells; time: time axis
+#### WS, isector: wind speed and LUT index from the first time step on; E2: altitude scaling (ncells);
+#### SVF: directed sky-view factors (ndir, ncells) (see SEB_preproc_SD.py)
+#### members: dict parameter -> values (nmember), see SEB_PARAMS and param_grid
+#### batch: members per time loop; workers: number of processes (None or 1: no pool)
+def seb_ensemble(T2, G, Prec, time, WS, isector, E2, SVF, members, batch=8, workers=None, backend=SEB_param_SD.backend):
+
+    defaults = {n: getattr(SEB_param_SD, n) for n in SEB_PARAMS}
+    params = _members(members, SEB_PARAMS, defaults)
+    nmem = len(params['c1'])
+
+    shared = dict(T2=np.ascontiguousarray(T2), G=np.ascontiguousarray(G), Prec=np.ascontiguousarray(Prec),
+                  WS=np.asarray(WS)[:len(T2)], isector=np.asarray(isector)[:len(T2)], E2=np.asarray(E2), SVF=np.asarray(SVF),
+                  st_p_day=SEB_param_SD.st_p_day, sec_per_hr=SEB_param_SD.sec_per_hr, dt=SEB_param_SD.dt,
+                  lm=SEB_param_SD.lm, rho_water=SEB_param_SD.rho_water, backend=backend)
+
+    ## members sorted by (temp_thresh, Dmax), so the members of a batch share the preprocessing
+    order = np.lexsort((params['Dmax'], params['temp_thresh']))
+    batches = [order[i:i + batch] for i in range(0, nmem, batch)]
+    results = _runBatches(_sebBatch, [{n: v[b] for n, v in params.items()} for b in batches], shared, workers)
+
+    series = np.zeros((len(T2), nmem))
+    missing = np.zeros(nmem, dtype=int)
+    for b, (res, miss) in zip(batches, results):
+        series[:, b] = res
+        missing[b] = miss
+    _warnMissing(missing, np.shape(T2)[1])
+
+    return _summary(series, time, params)
+
+
+########################################################################################################################
+#### PDD ENSEMBLE
+########################################################################################################################
+
+#### one batch of members: glacier-wide mean SMB (time, nbatch) in m w.e. and cells without SMB (nbatch)
+def _pddBatch(params):
+    f = _shared
+    nt, nc = f['Temp'].shape
+    nb = len(params['DDFice'])
+
+    ACC, MELT, SMB = pdd_cells(np.tile(f['Temp'], (1, nb)), np.tile(f['Prec'], (1, nb)), f['dt'],
+                               np.repeat(params['M_thresh'], nc), np.repeat(params['S_thresh'], nc),
+                               np.repeat(params['DDFice'], nc), np.repeat(params['DDFsnow'], nc), f['backend'])
+
+    series, missing = _cellMean(SMB.reshape(nt, nb, nc))
+    return series / 1000, missing
+
+
+#### Temp (°C), Prec (mm): (time, ncells) on the glacier cells; time: time axis
+#### members: dict parameter -> values (nmember), see PDD_PARAMS and param_grid
+def pdd_ensemble(Temp, Prec, time, members, batch=32, workers=None, backend=PDD_dt.backend):
+
+    defaults = {n: getattr(PDD_dt, n) for n in PDD_PARAMS}
+    params = _members(members, PDD_PARAMS, defaults)
+    nmem = len(params['DDFice'])
+
+    shared = dict(Temp=np.ascontiguousarray(Temp), Prec=np.ascontiguousarray(Prec), dt=PDD_dt.dt, backend=backend)
+
+    batches = [np.arange(i, min(i + batch, nmem)) for i in range(0, nmem, batch)]
+    results = _runBatches(_pddBatch, [{n: v[b] for n, v in params.items()} for b in batches], shared, workers)
+
+    series = np.zeros((len(Temp), nmem))
+    missing = np.zeros(nmem, dtype=int)
+    for b, (res, miss) in zip(batches, results):
+        series[:, b] = res
+        missing[b] = miss
+    _warnMissing(missing, np.shape(Temp)[1])
+
+    return _summary(series, time, params)
+
+
+########################################################################################################################
+#### SCRIPT
+########################################################################################################################
+
+if __name__ == '__main__':
+
+    from domain import loadDomain
+    from SEB_preproc_SD import altitude_scaling, svf_table, wind_sectors
+    from SEB_IO_SD import load_wind
+
+    #### settings
+    seb_input = './data/ERA5_G_input_bell.nc'          # input of the SEB model
+    pdd_input = '../SES7/data/ERA5_input_bell.nc'      # input of the PDD model
+    svf_file = './SVF/LUT_SVFdir45.nc'                 # look-up table of directed sky-view factors
+    wind_file = './data/wind_data.nc'                  # wind direction and speed (see wind.py)
+    outdir = './output'
+    workers = None                                     # number of processes (None: no pool)
+
+    seb_members = param_grid(c1=[20, 30, 40], c0=[-60, -40, -20], p2=[0.12, 0.155, 0.19])
+    pdd_members = param_grid(DDFice=[5.0, 7.0, 9.0], DDFsnow=[3.0, 4.0, 5.0])
+
+    #### SEB: read the forcing once
+    ds = xr.open_dataset(seb_input)
+    dom = loadDomain(seb_input)
+    T2 = dom.gather(ds.T2) - 273.15
+    G = dom.gather(ds.G)
+    Prec = dom.gather(ds.RRR) / 1000
+    DIR, WS = load_wind(wind_file, ds.time.values)
+    with xr.open_dataset(svf_file) as dsSVF:
+        SVF_dirs, SVF = svf_table(dsSVF.SVFdir, dom)
+
+    print('SEB ENSEMBLE: %d members' % len(seb_members['c1']))
+    seb = seb_ensemble(T2, G, Prec, ds.time.values, WS, wind_sectors(DIR, SVF_dirs),
+                       altitude_scaling(ds.HGT, dom), SVF, seb_members, workers=workers)
+    seb.to_netcdf(os.path.join(outdir, 'Bell_SMB_ensemble_SEB.nc'))
+    ds.close()
+
+    #### PDD
+    ds = xr.open_dataset(pdd_input)
+    dom = loadDomain(pdd_input)
+    Temp = dom.gather(ds.T2) - 273.15
+    Prec = dom.gather(ds.RRR)
+
+    print('PDD ENSEMBLE: %d members' % len(pdd_members['DDFice']))
+    pdd = pdd_ensemble(Temp, Prec, ds.time.values, pdd_members, workers=workers)
+    pdd.to_netcdf(os.path.join(outdir, 'Bell_SMB_ensemble_PDD.nc'))
+    ds.close()
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+#### default lapse rates (as in 4_crear_input_data_G_ERA5.ipynb)
+LAPSE_T = -6.5 / 1000      # temperature (K / m)
+LAPSE_RRR = 0.10 / 100     # precipitation (mm / m)
+RRR_MIN = 0.20             # ERA5 precipitation (mm) up to which no precipitation is assumed
+GRAVITY = 9.81
+
+
+def interpWeights(src, dst):
+    """ Linear interpolation from the coordinates src to dst, constant beyond the first and last value
+
+    returns the indices (len(dst), 2) of the two neighbours in src and their weights (len(dst), 2)
+    """
+    src = np.asarray(src, dtype=float)
+    dst = np.asarray(dst, dtype=float)
+    if len(src) == 1:
+        return np.zeros((len(dst), 2), dtype=int), np.column_stack([np.ones(len(dst)), np.zeros(len(dst))])
+
+    order = np.argsort(src)                      # ERA5 latitudes are descending
+    s = src[order]
+    x = np.clip(dst, s[0], s[-1])
+    i = np.clip(np.searchsorted(s, x, side='right') - 1, 0, len(s) - 2)
+    w = (x - s[i]) / (s[i + 1] - s[i])
+    return np.column_stack([order[i], order[i + 1]]), np.column_stack([1 - w, w])
+
+
+def lapseRate(T2, RRR, dz, lapse_T=LAPSE_T, lapse_RRR=LAPSE_RRR, rrr_min=RRR_MIN):
+    """ Temperature and precipitation at the altitude of the cells, all time steps at once
+
+    T2, RRR ....... temperature (K) and precipitation (mm) at the ERA5 altitude (time, ...), or None
+    dz ............ altitude of the cells minus altitude of ERA5 (m), broadcast against T2
+    returns T2 (K) and RRR (mm); RRR is zero where the ERA5 precipitation is at most rrr_min
+    """
+    if T2 is not None:
+        T2 = T2 + dz * lapse_T
+    if RRR is not None:
+        RRR = np.maximum(np.where(RRR <= rrr_min, 0.0, RRR + dz * lapse_RRR), 0.0)
+    return T2, RRR
+
+
+class Downscaling:
+    """ Temperature and precipitation of ERA5 downscaled to the model cells
+
+    The ERA5 fields (one or several grid points) are interpolated bilinearly to the cells and then
+    corrected with the lapse rates for the difference between the altitude of the cells and the
+    (interpolated) ERA5 orography. Only the time steps that are asked for are read, so the models
+    can compute their forcing chunk by chunk and no (time, lat, lon) cube has to be written.
+
+    era5 .......... ERA5 file or Dataset with t2m (K), tp (m) and z (m**2 s**-2), dimensions
+                    (valid_time or time, latitude, longitude)
+    HGT ........... altitude of the domain (lat, lon)
+    lats, lons .... coordinates of the domain
+    dom ........... None: results on the grid (time, lat, lon); Domain: on the glacier cells (time, ncells)
+    time .......... time axis of the model (datetime64), None: all time steps of ERA5
+    zE ............ ERA5 orography (m) instead of z / GRAVITY
+
+        down = Downscaling('../SES7/data/ERA5_bell.nc', HGT, lats, lons, dom)
+        T2, RRR = down(slice(0, 744))
+    """
+
+    def __init__(self, era5, HGT, lats, lons, dom=None, time=None, lapse_T=LAPSE_T, lapse_RRR=LAPSE_RRR,
+                 rrr_min=RRR_MIN, zE=None):
+        ds = era5 if isinstance(era5, xr.Dataset) else xr.open_dataset(era5)
+        if 'valid_time' in ds.dims:
+            ds = ds.rename(valid_time='time')
+        self.era5 = ds
+        self.lapse_T = lapse_T
+        self.lapse_RRR = lapse_RRR
+        self.rrr_min = rrr_min
+        self.dom = dom
+        self.shape = np.shape(HGT)
+
+        ## time steps of ERA5 for the time axis of the model
+        etime = np.asarray(ds.time)
+        if time is None:
+            tidx = np.arange(len(etime))
+        else:
+            tidx = pd.DatetimeIndex(etime).get_indexer(pd.DatetimeIndex(np.asarray(time)))
+            if np.any(tidx < 0):
+                raise ValueError('%d time steps of the model are not in the ERA5 data, e.g. %s'
+                                 % (np.sum(tidx < 0), np.asarray(time)[tidx < 0][0]))
+        self.tidx = tidx
+
+        ## the four ERA5 neighbours and bilinear weights of every cell (flat index into latitude x longitude)
+        iy, wy = interpWeights(ds.latitude, lats)
+        ix, wx = interpWeights(ds.longitude, lons)
+        nlon = ds.sizes['longitude']
+        idx = (iy[:, None, :, None] * nlon + ix[None, :, None, :]).reshape(len(lats) * len(lons), 4)
+        wgt = (wy[:, None, :, None] * wx[None, :, None, :]).reshape(len(lats) * len(lons), 4)
+        hgt = np.asarray(HGT, dtype=float).reshape(-1)
+        if dom is not None:
+            idx, wgt, hgt = idx[dom.index], wgt[dom.index], hgt[dom.index]
+        self.idx = idx
+        self.wgt = wgt
+
+        ## ERA5 orography and altitude difference of the cells
+        if zE is None:
+            z = ds.z[0] if 'time' in ds.z.dims else ds.z
+            zE = np.asarray(z) / GRAVITY
+        self.zE = np.asarray(zE, dtype=float)
+        self.dz = hgt - self.interp(np.broadcast_to(self.zE, (ds.sizes['latitude'], ds.sizes['longitude']))[None])[0]
+
+    def interp(self, field):
+        """ ERA5 field (time, latitude, longitude) -> cells (time, ncells) """
+        field = np.asarray(field, dtype=float).reshape(len(field), -1)
+        return np.einsum('tck,ck->tc', field[:, self.idx], self.wgt)
+
+    def read(self, name, sl=slice(None), scale=None):
+        """ ERA5 variable (times scale) at the time steps sl of the model, on the cells """
+        tidx = self.tidx[sl]
+        if len(tidx) > 0 and np.all(np.diff(tidx) == 1):
+            tidx = slice(tidx[0], tidx[-1] + 1)  # contiguous: read as one block
+        field = np.asarray(self.era5[name][tidx])
+        return self.interp(field if scale is None else field * scale)
+
+    def _shape(self, cells):
+        return cells if self.dom is not None else cells.reshape((len(cells),) + self.shape)
+
+    def temperature(self, sl=slice(None)):
+        """ T2 (K) of the time steps sl """
+        T2, RRR = lapseRate(self.read('t2m', sl), None, self.dz, self.lapse_T, self.lapse_RRR, self.rrr_min)
+        return self._shape(T2)
+
+    def precipitation(self, sl=slice(None)):
+        """ RRR (mm) of the time steps sl """
+        T2, RRR = lapseRate(None, self.read('tp', sl, 1000), self.dz, self.lapse_T, self.lapse_RRR, self.rrr_min)
+        return self._shape(RRR)
+
+    def __call__(self, sl=slice(None)):
+        """ T2 (K) and RRR (mm) of the time steps sl """
+        return self.temperature(sl), self.precipitation(sl)
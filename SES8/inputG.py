@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+from radCor import correctRadiationVec
+from solpos import correctRadiationTable
+from ncstream import createNC, writeNC
+from instrument import run_stats, stage
+
+
+def timeAxis(time):
+    """ Day of year and (decimal) hour of all time steps, derived once from the time coordinate """
+    time = pd.DatetimeIndex(np.asarray(time))
+    doy = np.asarray(time.dayofyear, dtype=float)
+    hour = np.asarray(time.hour + time.minute / 60.0, dtype=float)
+    return doy, hour
+
+
+def radiationChunks(time, lats, lons, slope, aspect, mask, sw, timezone_lon, zeni_thld, chunk=744, tab=None,
+                    horizon=None):
+    """ Corrected radiation G for the glacier, chunk by chunk in time
+
+    time .............. time axis (datetime64)
+    lats, lons ........ coordinates of the domain
+    slope, aspect ..... slope and aspect (south==0, east==negative, west==positive) grids (deg)
+    mask .............. glacier mask
+    sw ................ incoming shortwave radiation (W/m2), series (time,) or function(slice) -> series
+    tab ............... optional solar table (see solpos.solarTable), then the solar angles are not recalculated
+    horizon ........... optional horizon angles (deg) as DataArray (azimuth, lat, lon), e.g. from
+                        SVF/horizonCache.horizonLookup; the beam radiation is removed where the
+                        sun is below the local horizon
+
+    yields (slice, G) with G of shape (len(slice), lat, lon), NaN outside the glacier
+    """
+    doy, hour = timeAxis(time)
+    Hmax, horizon_azi = None, None
+    if horizon is not None:
+        Hmax = np.asarray(horizon)
+        horizon_azi = np.asarray(horizon['azimuth'])
+    for t0 in range(0, len(doy), chunk):
+        sl = slice(t0, min(t0 + chunk, len(doy)))
+        with stage('radiation', np.size(mask), sl.stop - sl.start, chunk=t0 // chunk):
+            Rm = sw(sl) if callable(sw) else np.asarray(sw)[sl]
+            if tab is None:
+                G = correctRadiationVec(lats, lons, timezone_lon, doy[sl], hour[sl], slope, aspect, Rm, zeni_thld,
+                                        Hmax, horizon_azi)
+            else:
+                G = correctRadiationTable(tab.isel(time=sl), slope, aspect, Rm, zeni_thld, Hmax, horizon_azi)
+            G = np.maximum(0.0, G)
+            G[:, mask != 1] = np.nan
+        yield sl, G
+
+
+def buildG(ds_met, ds_sta, outfile, timezone_lon=-90.0, zeni_thld=85.0, chunk=744, tab=None, extra=None,
+           horizon=None):
+    """ Create the input file of the glacier models (domain + G and optional other forcing)
+
+    The file is written chunk by chunk in time, so the cost grows linearly with the length
+    of the record and only one chunk is kept in memory.
+
+    ds_met ........ ERA5 data of the grid point (ssrd in J/m2 per hour, time coordinate valid_time or time)
+    ds_sta ........ domain (HGT, MASK, SLOPE, ASPECT with north==0)
+    outfile ....... output file (e.g. './data/ERA5_G_input_bell.nc')
+    chunk ......... number of time steps per chunk
+    tab ........... optional solar table (see solpos.loadSolarTable)
+    extra ......... dictionary name -> (data, units, long_name) of other (time,lat,lon) variables to be
+                    written (e.g. T2, RRR); data is an array or a function(slice) -> array
+    horizon ....... optional horizon angles (azimuth, lat, lon) for the terrain shading (see radiationChunks)
+    """
+    time = ds_met['valid_time'] if 'valid_time' in ds_met.coords else ds_met['time']
+    time = np.asarray(time)
+
+    # Change aspect to south==0, east==negative, west==positive
+    aspect = ds_sta.ASPECT.values - 180.0
+    mask = ds_sta.MASK.values
+    slope = ds_sta.SLOPE.values
+    lats = ds_sta.lat.values
+    lons = ds_sta.lon.values
+
+    def sw(sl):
+        return ds_met.ssrd[sl, 0, 0].values / 3600   # convertir de julios para W/m^2
+
+    variables = {'G': dict(units='W m⁻²', long_name='Incoming shortwave radiation')}
+    for name, (data, units, long_name) in (extra or {}).items():
+        variables[name] = dict(units=units, long_name=long_name)
+
+    static = {name: (ds_sta[name].values, ds_sta[name].attrs) for name in ds_sta.data_vars
+              if ds_sta[name].dims == ('lat', 'lon')}
+
+    with run_stats('G', ncells=np.size(mask), nt=len(time), chunk=chunk):
+        nc = createNC(outfile, time, lats, lons, variables, static, chunk_time=chunk)
+        try:
+            for sl, G in radiationChunks(time, lats, lons, slope, aspect, mask, sw, timezone_lon, zeni_thld, chunk, tab,
+                                         horizon):
+                with stage('write', np.size(mask), sl.stop - sl.start, chunk=sl.start // chunk):
+                    out = {'G': G}
+                    for name, (data, units, long_name) in (extra or {}).items():
+                        out[name] = data(sl) if callable(data) else np.asarray(data[sl])
+                    writeNC(nc, sl.start, **out)
+        finally:
+            nc.close()
+
+    return outfile
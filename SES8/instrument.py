@@ -0,0 +1,148 @@
+""" Run statistics of the processing stages (read, snowdrift, albedo, time loop, write, ...)
+
+Every stage records wall time, CPU time, peak RSS of the process, bytes read and written (rchar/wchar of
+/proc/self/io, None where not available) and, if the number of cells and time steps is given, the throughput
+in cells-timesteps per second. The records are written as JSON lines; at the end of a run one line with the
+totals of every stage follows. Optionally the whole run is profiled with cProfile.
+
+The statistics are switched on without changing the code, with the environment variables
+
+    SMB_STATS ...... file the JSON lines are appended to ('-': standard error)
+    SMB_PROFILE .... file for the cProfile dump of the run (see pstats)
+
+or the --stats/--profile options of the command lines, or from a script with configure(stats, profile).
+Without them the stages and runs do nothing. Workers of a process pool write their stages to the same file
+when they are configured with settings() of the main process (see LUT_SVFdir45.initWorker).
+
+    with run_stats('seb', ncells=dom.ncells, nt=len(time)):
+        with stage('read', ncells=dom.ncells, nt=nchunk):
+            ...
+"""
+import os
+import sys
+import json
+import time
+import cProfile
+import contextlib
+
+try:
+    import resource
+except ImportError:                      # not available on Windows
+    resource = None
+
+_config = dict(stats=os.environ.get('SMB_STATS'), profile=os.environ.get('SMB_PROFILE'))
+_run = []                                # stack of the active runs: (name, totals)
+
+
+def configure(stats=None, profile=None):
+    """ Switch the statistics on (or off with None)
+
+    stats ......... file the JSON lines are appended to ('-': standard error)
+    profile ....... file for the cProfile dump of the next runs
+    """
+    _config['stats'] = stats
+    _config['profile'] = profile
+
+
+def settings():
+    """ Current (stats, profile), e.g. to configure the workers of a process pool the same way """
+    return _config['stats'], _config['profile']
+
+
+def peak_rss():
+    """ Peak resident memory of the process so far (MB), None if unknown """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10     # bytes on macOS, kB on Linux
+
+
+def io_bytes():
+    """ Bytes read and written by the process so far (rchar, wchar), (None, None) if unknown """
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(':') for line in f if ':' in line)
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def emit(record):
+    """ Write one record as JSON line """
+    if _config['stats'] is None:
+        return
+    line = json.dumps(record, default=lambda x: x.item() if hasattr(x, 'item') else str(x)) + '\n'   # numpy scalars
+    if _config['stats'] == '-':
+        sys.stderr.write(line)
+    else:
+        with open(_config['stats'], 'a') as f:
+            f.write(line)
+
+
+@contextlib.contextmanager
+def stage(name, ncells=None, nt=None, **info):
+    """ Measure the block as one stage of the active run
+
+    ncells, nt .... number of glacier cells and time steps of the stage (for the throughput)
+    info .......... other values written with the record (e.g. chunk=3)
+    """
+    if _config['stats'] is None:
+        yield
+        return
+
+    r0, w0 = io_bytes()
+    c0 = time.process_time()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - t0
+        cpu = time.process_time() - c0
+        r1, w1 = io_bytes()
+        record = dict(run=_run[-1][0] if _run else None, stage=name, pid=os.getpid(), wall_s=wall, cpu_s=cpu,
+                      peak_rss_mb=peak_rss(),
+                      read_bytes=None if r0 is None else r1 - r0, written_bytes=None if w0 is None else w1 - w0)
+        if ncells is not None and nt is not None:
+            record.update(ncells=ncells, nt=nt, cell_steps_per_s=ncells * nt / wall if wall > 0 else None)
+        record.update(info)
+        emit(record)
+
+        if _run:
+            total = _run[-1][1].setdefault(name, dict(wall_s=0.0, cpu_s=0.0, read_bytes=0, written_bytes=0,
+                                                      cell_steps=0, calls=0))
+            total['calls'] += 1
+            for key in ['wall_s', 'cpu_s', 'read_bytes', 'written_bytes']:
+                total[key] = None if (total[key] is None or record[key] is None) else total[key] + record[key]
+            total['cell_steps'] += int((ncells or 0) * (nt or 0))
+
+
+@contextlib.contextmanager
+def run_stats(name, **info):
+    """ One model run: the totals of its stages are written at the end, with SMB_PROFILE the run is profiled
+
+    info .......... values written with the record of the run (e.g. ncells, nt)
+    """
+    profile = _config['profile']
+    if _config['stats'] is None and profile is None:
+        yield
+        return
+
+    prof = cProfile.Profile() if profile is not None else None
+    _run.append((name, {}))
+    c0 = time.process_time()
+    t0 = time.perf_counter()
+    if prof is not None:
+        prof.enable()
+    try:
+        yield
+    finally:
+        if prof is not None:
+            prof.disable()
+            prof.dump_stats(profile)
+        wall = time.perf_counter() - t0
+        cpu = time.process_time() - c0
+        run, totals = _run.pop()
+        for total in totals.values():
+            total['cell_steps_per_s'] = total['cell_steps'] / total['wall_s'] if total['wall_s'] > 0 else None
+        emit(dict(run=run, stage='total', pid=os.getpid(), wall_s=wall, cpu_s=cpu, peak_rss_mb=peak_rss(),
+                  stages=totals, **info))
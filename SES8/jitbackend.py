@@ -0,0 +1,37 @@
+#### Optional numba backend for the model kernels (PDD_dt.py, SEB/SEB_kernel_SD.py)
+#### numba is not required: without it the compiled kernels are not available and the
+#### models use their numpy kernels
+########################################################################################################################
+
+import warnings
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """ Stand-in for numba.njit: returns the function unchanged """
+        if (len(args) == 1) and callable(args[0]) and (len(kwargs) == 0):
+            return args[0]
+        return lambda f: f
+
+    prange = range
+
+
+def useNumba(backend):
+    """ Decide if the numba kernels are used
+
+    backend ... 'numpy' (never), 'numba' (always, falls back to numpy with a warning
+                if numba is not installed) or 'auto' (if numba is installed)
+    """
+    if backend == 'numpy':
+        return False
+    if backend == 'auto':
+        return HAVE_NUMBA
+    if backend == 'numba':
+        if not HAVE_NUMBA:
+            warnings.warn('numba is not installed, using the numpy backend')
+        return HAVE_NUMBA
+    raise ValueError("backend must be 'numpy', 'numba' or 'auto', not %r" % (backend,))
@@ -0,0 +1,70 @@
+import numpy as np
+import netCDF4
+
+
+def createNC(outfile, time, lats, lons, variables, static=None, dtype='f8', zlib=False, complevel=4, chunk_time=None,
+             gridded=True):
+    """ Create a NetCDF file that is filled step by step (see writeNC), so the
+    (time, lat, lon) fields never have to be kept in memory at once
+
+    outfile ....... name of the file
+    time .......... time axis (datetime64)
+    lats, lons .... coordinates
+    variables ..... dictionary name -> dict(units=..., long_name=...) of the (time,lat,lon) variables
+                    (or (time,) variables if gridded is False, e.g. glacier-wide means)
+    static ........ dictionary name -> (array (lat,lon), attrs) written directly (e.g. HGT, MASK)
+    dtype ......... data type of the (time,lat,lon) variables (e.g. 'f4' to halve the file size)
+    zlib .......... compress the variables
+    chunk_time .... number of time steps per chunk in the file (default: netCDF default)
+    """
+    time = np.asarray(time, dtype='datetime64[s]')
+    lats = np.asarray(lats)
+    lons = np.asarray(lons)
+
+    nc = netCDF4.Dataset(outfile, 'w')
+    nc.createDimension('time', len(time))
+    nc.createDimension('lat', len(lats))
+    nc.createDimension('lon', len(lons))
+
+    t = nc.createVariable('time', 'f8', ('time',))
+    t.units = 'seconds since ' + str(time[0]).replace('T', ' ') if len(time) > 0 else 'seconds since 1970-01-01 00:00:00'
+    t.calendar = 'proleptic_gregorian'
+    if len(time) > 0:
+        t[:] = (time - time[0]) / np.timedelta64(1, 's')
+
+    v = nc.createVariable('lat', 'f8', ('lat',))
+    v.standard_name = 'latitude'
+    v.long_name = 'latitude'
+    v.units = 'degrees_north'
+    v[:] = lats
+
+    v = nc.createVariable('lon', 'f8', ('lon',))
+    v.standard_name = 'longitude'
+    v.long_name = 'longitude'
+    v.units = 'degrees_east'
+    v[:] = lons
+
+    for name, (arr, attrs) in (static or {}).items():
+        arr = np.asarray(arr)
+        v = nc.createVariable(name, arr.dtype, ('lat', 'lon'))
+        v.setncatts(dict(attrs))
+        v[:] = arr
+
+    dims = ('time', 'lat', 'lon') if gridded else ('time',)
+    chunks = None
+    if chunk_time is not None:
+        chunks = (max(1, min(int(chunk_time), len(time))), len(lats), len(lons))[:len(dims)]
+    for name, attrs in variables.items():
+        v = nc.createVariable(name, dtype, dims, zlib=zlib, complevel=complevel,
+                              chunksizes=chunks, fill_value=np.nan)
+        v.setncatts(dict(attrs))
+
+    return nc
+
+
+def writeNC(nc, t0, **arrays):
+    """ Write (time,lat,lon) or (time,) blocks starting at time index t0 and flush them to disk """
+    for name, arr in arrays.items():
+        arr = np.asarray(arr)
+        nc[name][t0:t0 + len(arr)] = arr
+    nc.sync()
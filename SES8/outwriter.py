@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+from ncstream import createNC
+
+FREQS = ['native', 'daily', 'monthly', 'annual']
+
+
+def periods(time, freq='native'):
+    """ Output periods of a time axis
+
+    time .......... time axis of the model (datetime64)
+    freq .......... 'native' (every time step), 'daily', 'monthly' or 'annual'
+
+    returns the start time of every period and the first and last+1 time index of every period
+    """
+    t = pd.DatetimeIndex(np.asarray(time))
+    if freq == 'native':
+        key = t
+    elif freq == 'daily':
+        key = t.floor('D')
+    elif freq == 'monthly':
+        key = t.to_period('M').to_timestamp()
+    elif freq == 'annual':
+        key = t.to_period('Y').to_timestamp()
+    else:
+        raise ValueError('freq must be one of %s, got %r' % (FREQS, freq))
+
+    key = np.asarray(key, dtype='datetime64[s]')
+    new = np.ones(len(key), dtype=bool)
+    new[1:] = key[1:] != key[:-1]
+    start = np.flatnonzero(new)
+    stop = np.append(start[1:], len(key))
+    return key[start], start, stop
+
+
+class OutputWriter:
+    """ Output file that is written during the run, chunk by chunk
+
+    The model results on the glacier cells (time, ncells) of every chunk are aggregated in time
+    (sum of the mass fluxes, mean of the other variables over every period) and optionally to
+    glacier-wide means, then written as compressed float32 (default) NetCDF. Periods that
+    continue in the next chunk are kept until they are complete. The inputs are not copied.
+
+    outfile ....... name of the file
+    time .......... time axis of the model (datetime64)
+    dom ........... Domain of the glacier cells (see domain.py)
+    variables ..... dictionary name -> (attrs, how) with how 'sum' or 'mean' (time aggregation)
+    freq .......... 'native', 'daily', 'monthly' or 'annual'
+    mean .......... True: glacier-wide means (time,) instead of grids (time, lat, lon)
+    static ........ dictionary name -> (array (lat,lon), attrs), e.g. HGT, MASK
+    dtype, zlib, complevel .... encoding of the variables
+    """
+
+    def __init__(self, outfile, time, dom, variables, freq='native', mean=False, static=None,
+                 dtype='f4', zlib=True, complevel=4):
+        if dom.lats is None or dom.lons is None:
+            raise ValueError('the Domain needs the coordinates lats and lons for the output')
+        self.outfile = outfile
+        self.dom = dom
+        self.freq = freq
+        self.mean = mean
+        self.how = {name: how for name, (attrs, how) in variables.items()}
+        self.ptime, self.start, self.stop = periods(time, freq)
+        self.pending = {}                      # sums and counts of the period that is not complete yet
+
+        attrs = {}
+        for name, (a, how) in variables.items():
+            attrs[name] = dict(a)
+            methods = ['time: %s' % how] if freq != 'native' else []
+            if mean:
+                methods.append('area: mean (glacier)')
+            if methods:
+                attrs[name]['cell_methods'] = ' '.join(methods)
+
+        chunk_time = None if mean else 1 if freq != 'native' else min(len(self.ptime), 24)
+        self.nc = createNC(outfile, self.ptime, dom.lats, dom.lons, attrs, static, dtype=dtype, zlib=zlib,
+                           complevel=complevel, chunk_time=chunk_time, gridded=not mean)
+        self.nc.setncattr('aggregation', freq)
+
+    def _reduce(self, values):
+        """ (..., ncells) -> grid (..., lat, lon) or glacier-wide mean (...) """
+        if self.mean:
+            with np.errstate(invalid='ignore'):
+                return np.nanmean(values, axis=-1) if values.shape[-1] > 0 else np.full(values.shape[:-1], np.nan)
+        return self.dom.scatter(values)
+
+    def write(self, t0, **fields):
+        """ Results (time, ncells) of the time steps t0, t0+1, ... (chunks in time order) """
+        nt = len(next(iter(fields.values())))
+        t1 = t0 + nt
+
+        if self.freq == 'native':
+            for name, values in fields.items():
+                self.nc[name][t0:t1] = self._reduce(np.asarray(values))
+            self.nc.sync()
+            return
+
+        for p in range(np.searchsorted(self.stop, t0, side='right'), np.searchsorted(self.start, t1 - 1, side='right')):
+            a = max(t0, self.start[p])
+            b = min(t1, self.stop[p])
+            for name, values in fields.items():
+                block = np.asarray(values[a - t0:b - t0], dtype=float)
+                s, n = self.pending.get(name, (0.0, 0))
+                self.pending[name] = (s + np.nansum(block, axis=0), n + np.sum(~np.isnan(block), axis=0))
+            if b == self.stop[p]:
+                self._flush(p)
+        self.nc.sync()
+
+    def _flush(self, p):
+        for name, (s, n) in self.pending.items():
+            with np.errstate(invalid='ignore', divide='ignore'):
+                value = s if self.how[name] == 'sum' else s / n
+            value = np.where(n > 0, value, np.nan)
+            self.nc[name][p] = self._reduce(value)
+        self.pending = {}
+
+    def close(self):
+        self.nc.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
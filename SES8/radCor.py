@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 def solarFParallel(lat, lon, timezone_lon, day, hour):
     """ Calculate solar elevation, zenith and azimuth angles
@@ -147,3 +148,192 @@ def correctRadiation(lat, lon, timezone_lon, doy, hour, angslo, azislo, Rm, zeni
 
     return Rc
 
+
+
+
+# Array versions of the functions above. They use numpy instead of math and np.where instead
+# of the scalar if-branches, so all inputs can be numpy arrays that broadcast against each
+# other (e.g. time as (time,1,1) and space as (lat,lon)).
+
+def solarFParallelVec(lat, lon, timezone_lon, day, hour):
+    """ Array version of solarFParallel (same inputs and outputs) """
+
+    # Calculate conversion factor degree to radians
+    FAC = np.pi / 180.0
+
+    # Solar declinations (radians)
+    dec = np.arcsin(0.39785 * np.sin((278.97 + 0.9856 * day + 1.9165 *
+        np.sin((356.6 + 0.9856 * day) * FAC)) * FAC))
+
+    # (day length is not needed for the angles and is skipped here)
+
+    # Teta (radians), time equation (hours)
+    teta = (279.575 + 0.9856 * day) * FAC
+    timeEq = (-104.7 * np.sin(teta) + 596.2 * np.sin(2.0 * teta) + 4.3 *
+        np.sin(3.0 * teta) - 12.7 * np.sin(4.0 * teta) - 429.3 *
+        np.cos(teta) - 2.0 * np.cos(2.0 * teta) + 19.3 * np.cos(3.0 * teta)) / 3600.0
+
+    # Longitude correction (hours)
+    LC = (timezone_lon - lon) / 15.0
+
+    # Solar noon (hours) / solar time (hours)
+    solarnoon = 12.0 - LC - timeEq
+    solartime = hour - LC - timeEq
+
+    # Solar elevation
+    beta = np.arcsin(np.sin(lat * FAC) * np.sin(dec) + np.cos(lat * FAC) *
+        np.cos(dec) * np.cos(15.0 * FAC * (solartime-solarnoon)))
+
+    # Zenith angle (radians)
+    zeni = np.pi/2.0 - beta
+
+    # Azimuth angle (radians)
+    azi = np.arccos(np.clip(np.sin(lat * FAC) * np.cos(zeni) - np.sin(dec), -1.0, 1.0))/np.cos(lat*FAC)*np.sin(zeni)
+
+    azi = np.where(solartime < solarnoon, -1.0 * azi, azi)
+
+    return beta, zeni, azi
+
+
+def Fdif_NeustiftVec(doy, zeni, Rg):
+    """ Array version of Fdif_Neustift (same inputs and outputs) """
+    So = 1367.0 * (1 + 0.033 * np.cos(2.0 * np.pi * doy / 366.0)) * np.cos(zeni)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        CI = Rg / So
+
+        # empirical parameters from Wohlfahrt et al. (2016) (Appendix C)
+        p1 = 0.1001
+        p2 = 4.7930
+        p3 = 9.4758
+        p4 = 0.2465
+
+        # Eq. C1 in Wohlfahrt et al. (2016), constant p4 for CI > 50
+        Fdif = np.where(CI > 50, p4, np.exp(-np.exp(p1 - (p2 - p3 * CI))) * (1.0 - p4) + p4)
+    return Fdif
+
+
+def radCor2DVec(doy, zeni, azi, angslo, azislo, Rm, zeni_thld, shaded=None):
+    """ Array version of radCor2D
+
+    doy, zeni, azi and Rm can be arrays as well (e.g. with shape (time,1,1)),
+    the output has the broadcast shape of all inputs (e.g. (time,lat,lon))
+
+    shaded ... optional boolean array (True where the sun is below the local horizon),
+               there the beam component is set to zero
+    """
+
+    # Calculate conversion factor degree to radians
+    FAC = np.pi / 180.0
+
+    # Derive fraction of diffuse radiation
+    Fdif = Fdif_NeustiftVec(doy, zeni, Rm)
+    Fdif = np.where(zeni > np.radians(zeni_thld), 1.0, Fdif)
+
+    # Split measured global radiation into beam and diffuse part
+    Rb = Rm * (1.0 - Fdif)  # Beam radiation
+    Rd = Rm * Fdif          # Diffuse radiation
+
+    # Correct beam component for angle and azimuth of pixels
+    cf = (np.cos(zeni) * np.cos(angslo*FAC) + np.sin(zeni) * np.sin(angslo*FAC) * \
+            np.cos(azi-(azislo*FAC))) / np.cos(zeni)
+
+    # No beam radiation in the shadow of the surrounding terrain
+    if shaded is not None:
+        Rb = np.where(shaded, 0.0, Rb)
+
+    Rc = Rb * cf + Rd
+
+    return Rc
+
+
+def solarAzimuthNorthVec(lat, lon, timezone_lon, day, hour):
+    """ Solar azimuth measured clockwise from north (deg), as used for the horizon angles
+    of the relief shading (SVF/relshadFunct_SD.py)
+
+    same inputs as solarFParallelVec
+    """
+
+    # Calculate conversion factor degree to radians
+    FAC = np.pi / 180.0
+
+    # Solar declinations (radians)
+    dec = np.arcsin(0.39785 * np.sin((278.97 + 0.9856 * day + 1.9165 *
+        np.sin((356.6 + 0.9856 * day) * FAC)) * FAC))
+
+    # Teta (radians), time equation (hours)
+    teta = (279.575 + 0.9856 * day) * FAC
+    timeEq = (-104.7 * np.sin(teta) + 596.2 * np.sin(2.0 * teta) + 4.3 *
+        np.sin(3.0 * teta) - 12.7 * np.sin(4.0 * teta) - 429.3 *
+        np.cos(teta) - 2.0 * np.cos(2.0 * teta) + 19.3 * np.cos(3.0 * teta)) / 3600.0
+
+    # Hour angle (radians, positive in the afternoon)
+    LC = (timezone_lon - lon) / 15.0
+    hang = 15.0 * FAC * ((hour - LC - timeEq) - (12.0 - LC - timeEq))
+
+    # Azimuth from south (west positive), turned to azimuth from north
+    azs = np.arctan2(np.sin(hang), np.cos(hang) * np.sin(lat * FAC) - np.tan(dec) * np.cos(lat * FAC))
+
+    return (np.degrees(azs) + 180.0) % 360.0
+
+
+def horizonAtAzimuth(Hmax, horizon_azi, sazi):
+    """ Horizon angle in the direction of the sun
+
+    linear interpolation between the two neighbouring azimuth bins of a horizon look-up table,
+    so no ray tracing is needed for the individual time steps
+
+    Hmax ........... horizon angles (deg) with shape (azimuth, lat, lon)
+    horizon_azi .... azimuths of the table (deg from north), equally spaced around the circle (e.g. 0, 5, ..., 355)
+    sazi ........... solar azimuth (deg from north), e.g. with shape (time,1,1) or (time,lat,lon)
+    Hsun ........... horizon angle towards the sun (deg), shape (time,lat,lon)
+    """
+    Hmax = np.asarray(Hmax, dtype=float)
+    horizon_azi = np.asarray(horizon_azi, dtype=float)
+    nazi = len(horizon_azi)
+    step = 360.0 / nazi
+
+    pos = ((np.asarray(sazi, dtype=float) - horizon_azi[0]) % 360.0) / step
+    i0 = np.floor(pos).astype(int) % nazi
+    i1 = (i0 + 1) % nazi
+    w = pos - np.floor(pos)
+
+    shape = np.broadcast_shapes(np.shape(pos)[:-2] + (1, 1), (1,) + Hmax.shape[1:])
+    i0 = np.broadcast_to(i0, shape)
+    i1 = np.broadcast_to(i1, shape)
+
+    return (1.0 - w) * np.take_along_axis(Hmax, i0, axis=0) + w * np.take_along_axis(Hmax, i1, axis=0)
+
+
+def correctRadiationVec(lat, lon, timezone_lon, doy, hour, angslo, azislo, Rm, zeni_thld,
+                        horizon=None, horizon_azi=None):
+    """ Corrected radiation for all time steps and grid cells in one call
+
+    doy, hour, Rm ...... time series with shape (time,)
+    lat, lon ........... coordinates (lat,) and (lon,), or grids with shape (lat,lon)
+    angslo, azislo ..... slope and aspect grids (lat,lon)
+    horizon ............ optional horizon angles (deg) with shape (azimuth,lat,lon) to include the shading
+                         by the surrounding terrain (see horizonAtAzimuth)
+    horizon_azi ........ azimuths of the horizon table (deg from north)
+    Rc ................. corrected solar radiation with shape (time,lat,lon)
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    if (lat.ndim == 1) and (lon.ndim == 1):
+        lat, lon = np.meshgrid(lat, lon, indexing='ij')
+
+    # time along the first axis
+    doy = np.asarray(doy, dtype=float).reshape(-1, 1, 1)
+    hour = np.asarray(hour, dtype=float).reshape(-1, 1, 1)
+    Rm = np.asarray(Rm, dtype=float).reshape(-1, 1, 1)
+
+    beta, zeni, azi = solarFParallelVec(lat, lon, timezone_lon, doy, hour)
+
+    shaded = None
+    if horizon is not None:
+        sazi = solarAzimuthNorthVec(lat, lon, timezone_lon, doy, hour)
+        shaded = np.degrees(beta) < horizonAtAzimuth(horizon, horizon_azi, sazi)
+
+    Rc = radCor2DVec(doy, zeni, azi, angslo, azislo, Rm, zeni_thld, shaded)
+
+    return Rc
@@ -0,0 +1,131 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from radCor import solarFParallelVec, solarAzimuthNorthVec, horizonAtAzimuth, radCor2DVec
+
+VERSION = 3   # increase when the content of the table changes (old tables are recalculated)
+ANGLES = ['beta', 'zeni', 'azi', 'sazi']   # (time, lat, lon) variables, kept in single precision in the saved tables
+
+
+def solarTable(lats, lons, timezone_lon, time, reduce=False):
+    """ Solar position for all time steps of a domain
+
+    Inputs:
+
+        lats, lons      ::  coordinates of the domain (decimal degree)
+        timezone_lon    ::  longitude of standard meridian (decimal degree)
+        time            ::  time axis (datetime64)
+        reduce          ::  if True, the position is only calculated for the centre of
+                            the domain (table with shape (time,)), which is enough for
+                            small glaciers where lat/lon hardly change
+
+    Outputs:
+
+        xarray Dataset with doy, hour, the solar angles beta, zeni, azi (radians)
+        and the solar azimuth from north sazi (deg) with shape (time, lat, lon) or (time,)
+    """
+    time = pd.DatetimeIndex(np.asarray(time))
+    doy = np.asarray(time.dayofyear, dtype=float)
+    hour = np.asarray(time.hour + time.minute / 60.0, dtype=float)
+
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+
+    if reduce:
+        lat = np.mean(lats)
+        lon = np.mean(lons)
+        dims = ('time',)
+        beta, zeni, azi = solarFParallelVec(lat, lon, timezone_lon, doy, hour)
+        sazi = solarAzimuthNorthVec(lat, lon, timezone_lon, doy, hour)
+    else:
+        lat, lon = np.meshgrid(lats, lons, indexing='ij')
+        dims = ('time', 'lat', 'lon')
+        beta, zeni, azi = solarFParallelVec(lat, lon, timezone_lon, doy.reshape(-1, 1, 1), hour.reshape(-1, 1, 1))
+        sazi = solarAzimuthNorthVec(lat, lon, timezone_lon, doy.reshape(-1, 1, 1), hour.reshape(-1, 1, 1))
+
+    tab = xr.Dataset(coords=dict(time=np.asarray(time), lat=lats, lon=lons))
+    tab['doy'] = (('time',), doy)
+    tab['hour'] = (('time',), hour)
+    tab['beta'] = (dims, beta, dict(units='rad', long_name='Solar elevation angle'))
+    tab['zeni'] = (dims, zeni, dict(units='rad', long_name='Solar zenith angle'))
+    tab['azi'] = (dims, azi, dict(units='rad', long_name='Solar azimuth angle'))
+    tab['sazi'] = (dims, sazi, dict(units='deg', long_name='Solar azimuth angle from north'))
+    tab.attrs['timezone_lon'] = timezone_lon
+    tab.attrs['reduce'] = int(reduce)
+    tab.attrs['key'] = tableKey(lats, lons, timezone_lon, time, reduce)
+
+    return tab
+
+
+def tableKey(lats, lons, timezone_lon, time, reduce=False):
+    """ Hash of everything the solar table depends on """
+    h = hashlib.sha1()
+    for arr in (lats, lons, [timezone_lon, int(reduce), VERSION]):
+        h.update(np.ascontiguousarray(arr, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(np.asarray(time, dtype='datetime64[s]').astype(np.int64)).tobytes())
+    return h.hexdigest()
+
+
+def tableFile(domfile):
+    """ File of the solar table next to the domain file (e.g. Bell_dom.nc -> Bell_dom_solpos.nc) """
+    return os.path.splitext(domfile)[0] + '_solpos.nc'
+
+
+def loadSolarTable(domfile, time, timezone_lon, reduce=False):
+    """ Read the solar table of a domain, calculate and save it if it does not exist yet
+    or was made for another time axis, time zone or domain
+
+    The solar angles are kept in single precision (a quarter of a float64 table, about the size
+    of the G cube it speeds up); the radiation changes by less than 1e-3 W/m2. A new table is
+    rounded the same way, so the first and later runs give the same G.
+    """
+    with xr.open_dataset(domfile) as dom:
+        lats = np.array(dom.lat)
+        lons = np.array(dom.lon)
+
+    fname = tableFile(domfile)
+    key = tableKey(lats, lons, timezone_lon, time, reduce)
+
+    if os.path.exists(fname):
+        with xr.open_dataset(fname) as tab:
+            if tab.attrs.get('key') == key:
+                return tab.load()
+
+    tab = solarTable(lats, lons, timezone_lon, time, reduce)
+    for name in ANGLES:
+        tab[name] = tab[name].astype('f4')
+    tab.to_netcdf(fname)
+    return tab
+
+
+def correctRadiationTable(tab, angslo, azislo, Rm, zeni_thld, horizon=None, horizon_azi=None):
+    """ Same as radCor.correctRadiationVec, but with the solar angles taken from a
+    precomputed table (no trigonometry for the solar position)
+
+    tab ............... solar table (see solarTable)
+    angslo, azislo .... slope and aspect grids (lat,lon)
+    Rm ................ solar radiation measured horizontally, time series (time,)
+    horizon ........... optional horizon angles (azimuth,lat,lon) for the terrain shading
+    horizon_azi ....... azimuths of the horizon table (deg from north)
+    Rc ................ corrected solar radiation (time,lat,lon)
+    """
+    beta = np.asarray(tab.beta, dtype=float)
+    zeni = np.asarray(tab.zeni, dtype=float)
+    azi = np.asarray(tab.azi, dtype=float)
+    sazi = np.asarray(tab.sazi, dtype=float)
+    if zeni.ndim == 1:
+        beta = beta.reshape(-1, 1, 1)
+        zeni = zeni.reshape(-1, 1, 1)
+        azi = azi.reshape(-1, 1, 1)
+        sazi = sazi.reshape(-1, 1, 1)
+    doy = np.asarray(tab.doy).reshape(-1, 1, 1)
+    Rm = np.asarray(Rm, dtype=float).reshape(-1, 1, 1)
+
+    shaded = None
+    if horizon is not None:
+        shaded = np.degrees(beta) < horizonAtAzimuth(horizon, horizon_azi, sazi)
+
+    return radCor2DVec(doy, zeni, azi, angslo, azislo, Rm, zeni_thld, shaded)
@@ -0,0 +1,163 @@
+#### Tiled execution of the SEB and PDD models for large (regional) domains
+#### The glacier cells are independent of each other (apart from the look-up of the sky-view factors and the
+#### altitude range of the snowdrift, which are taken from the whole domain), so the domain can be split into
+#### rectangular tiles (lat, lon) that run in parallel. Every worker reads only its tile from the input file
+#### (lazily, with dask chunks if dask is installed), runs the model and sends the result back; the results
+#### are written to the matching region of the output file as the tiles finish.
+#### Tiles without glacier cells are skipped.
+####
+#### usage:  python tiling.py seb --input ./data/ERA5_G_input_bell.nc --output ./output/out.nc --tile 50 50 --workers 4
+########################################################################################################################
+
+#### import required packages
+import os
+import sys
+import argparse
+import concurrent.futures
+import numpy as np
+import xarray as xr
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SEB'))
+from ncstream import createNC
+from PDD_dt import run_pdd
+from SEB_main_SD import run_seb, OUTPUT_VARS
+from SEB_IO_SD import load_svf, load_wind
+
+try:
+    import dask  # noqa: F401  (only needed for chunked reading)
+    HAVE_DASK = True
+except ImportError:
+    HAVE_DASK = False
+
+#### output variables of the models
+MODEL_VARS = dict(seb={name: attrs for name, (i, attrs, how) in OUTPUT_VARS.items()},
+                  pdd={name: dict(units='m w.e.') for name in ['ACC', 'MELT', 'SMB']})
+
+
+########################################################################################################################
+#### HELPER FUNCTIONS
+########################################################################################################################
+
+#### rectangular tiles (slice lat, slice lon) of size tile=(nlat, nlon) that contain glacier cells
+def makeTiles(MASK, tile):
+    MASK = np.asarray(MASK) != 0
+    ny, nx = MASK.shape
+    ty, tx = tile
+    tiles = []
+    for y0 in range(0, ny, ty):
+        for x0 in range(0, nx, tx):
+            ys, xs = slice(y0, min(y0 + ty, ny)), slice(x0, min(x0 + tx, nx))
+            if MASK[ys, xs].any():
+                tiles.append((ys, xs))
+    return tiles
+
+
+#### input file opened lazily (dask chunks of one tile if dask is installed)
+def openLazy(infile, tile=None, chunk_time=None):
+    if not HAVE_DASK:
+        return xr.open_dataset(infile)
+    chunks = {} if tile is None else dict(lat=tile[0], lon=tile[1])
+    if chunk_time is not None:
+        chunks['time'] = chunk_time
+    return xr.open_dataset(infile, chunks=chunks)
+
+
+#### output variables of a run: out_vars of params (default: all of the model); the tiles are written to one grid
+#### at every time step, so aggregated or glacier-wide output (out_freq, out_mean) cannot be tiled
+def tileVars(model, params):
+    params = params or {}
+    if params.get('out_freq', 'native') != 'native' or params.get('out_mean', False):
+        raise ValueError('tiled runs write every time step on the grid: out_freq must be native and out_mean False')
+    names = params.get('out_vars', list(MODEL_VARS[model]))
+    unknown = [name for name in names if name not in MODEL_VARS[model]]
+    if unknown:
+        raise ValueError('unknown output variables %s, use %s' % (unknown, list(MODEL_VARS[model])))
+    return {name: MODEL_VARS[model][name] for name in names}
+
+
+#### run the model on one tile, returns the tile and the (time, lat, lon) results of the tile
+def runTile(model, infile, ys, xs, tile, kwargs):
+    with openLazy(infile, tile) as ds:
+        sub = ds.isel(lat=ys, lon=xs)
+        if model == 'seb':
+            svf = kwargs['svf_lut'].isel(lat=ys, lon=xs)
+            out = run_seb(sub, None, svf, kwargs['wind'], kwargs['params'], verbose=False,
+                          hgt_range=kwargs['hgt_range'])
+        else:
+            out = run_pdd(sub, None, kwargs['params'], verbose=False)
+        return ys, xs, {name: np.asarray(out[name]) for name in tileVars(model, kwargs['params'])}
+
+
+########################################################################################################################
+#### TILED RUN
+########################################################################################################################
+
+#### model: 'seb' or 'pdd'; infile: input file; output: output file (NetCDF, filled tile by tile)
+#### tile: (nlat, nlon) cells per tile; workers: number of processes (None: all cores, 1: no pool)
+#### params: settings that differ from the defaults of the model; svf_lut, wind: see run_seb (SEB only)
+def run_tiled(model, infile, output, tile=(50, 50), workers=None, params=None, svf_lut=None, wind=None,
+              dtype='f4', zlib=True):
+
+    if model not in MODEL_VARS:
+        raise ValueError("model must be 'seb' or 'pdd', got %r" % model)
+    variables = tileVars(model, params)
+
+    with xr.open_dataset(infile) as ds:
+        MASK = np.array(ds.MASK)
+        HGT = np.array(ds.HGT)
+        time = np.array(ds.time)
+        lats = np.array(ds.lat)
+        lons = np.array(ds.lon)
+
+    kwargs = dict(params=params)
+    if model == 'seb':
+        ## the look-up table and the wind are small: read once and sent to the workers
+        kwargs['svf_lut'] = load_svf(svf_lut) if svf_lut is not None else load_svf()
+        kwargs['wind'] = load_wind(wind, time) if wind is not None else load_wind(time=time)
+        kwargs['hgt_range'] = (np.min(HGT), np.max(HGT))   # snowdrift scaling of the whole domain
+
+    tiles = makeTiles(MASK, tile)
+    print('%d tiles with glacier cells (%d x %d cells)' % (len(tiles), tile[0], tile[1]))
+
+    nc = createNC(output, time, lats, lons, variables,
+                  static=dict(HGT=(HGT, dict(units='m')), MASK=(MASK, dict())),
+                  dtype=dtype, zlib=zlib)
+    pool = None
+    try:
+        if workers == 1:
+            results = (runTile(model, infile, ys, xs, tile, kwargs) for ys, xs in tiles)
+        else:
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+            futures = [pool.submit(runTile, model, infile, ys, xs, tile, kwargs) for ys, xs in tiles]
+            results = (f.result() for f in concurrent.futures.as_completed(futures))
+
+        for n, (ys, xs, fields) in enumerate(results):
+            for name, values in fields.items():
+                nc[name][:, ys, xs] = values
+            nc.sync()
+            print('tile %d/%d finished' % (n + 1, len(tiles)))
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        nc.close()
+
+    return output
+
+
+########################################################################################################################
+#### COMMAND LINE
+########################################################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tiled run of the SEB or PDD model')
+    parser.add_argument('model', choices=['seb', 'pdd'])
+    parser.add_argument('--input', required=True, help='input file')
+    parser.add_argument('--output', required=True, help='output file')
+    parser.add_argument('--tile', type=int, nargs=2, default=[50, 50], metavar=('NLAT', 'NLON'), help='cells per tile')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all cores)')
+    parser.add_argument('--svf', default='./SVF/LUT_SVFdir45.nc', help='look-up table of directed sky-view factors (SEB)')
+    parser.add_argument('--wind', default='./data/wind_data.nc', help='wind direction and speed (SEB)')
+    args = parser.parse_args()
+
+    run_tiled(args.model, args.input, args.output, tuple(args.tile), args.workers,
+              svf_lut=args.svf if args.model == 'seb' else None, wind=args.wind if args.model == 'seb' else None)
@@ -0,0 +1,145 @@
+#### Preprocessing of the ERA5 wind for the snowdrift of the SEB model
+#### All ERA5_UV_*.nc files are opened together (xr.open_mfdataset if dask is installed, otherwise lazily one by one),
+#### the time axis is checked (sorted, no duplicates, regular, no gaps) and brought to the model time step dt.
+#### Wind direction and speed are computed for all time steps at once and written to a small NetCDF-3 file
+#### (DIR, WS in double precision, so the 5 deg sectors of the SEB model are the same as from the csv of the notebook)
+#### that SEB_IO_SD.load_wind memory-maps and aligns with the time axis of the forcing.
+####
+#### usage:  python wind.py --files "./data/ERA5_UV_*.nc" --out ./data/wind_data.nc --dt 6
+########################################################################################################################
+
+#### import required packages
+import glob
+import argparse
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+try:
+    import dask  # noqa: F401  (only needed for open_mfdataset)
+    HAVE_DASK = True
+except ImportError:
+    HAVE_DASK = False
+
+#### default settings
+FILES = './data/ERA5_UV_*.nc'     # ERA5 files with u10, v10
+OUTFILE = './data/wind_data.nc'   # output file
+DT = 6                            # model time step (hours)
+
+
+########################################################################################################################
+#### HELPER FUNCTIONS
+########################################################################################################################
+
+#### all files opened as one dataset with the time coordinate 'time' (data are read later, when needed)
+def openWind(files=FILES):
+    if isinstance(files, str):
+        files = sorted(glob.glob(files))
+    if len(files) == 0:
+        raise FileNotFoundError('no wind files found')
+    if HAVE_DASK:
+        ds = xr.open_mfdataset(files, combine='nested', concat_dim='valid_time', data_vars='minimal',
+                               coords='minimal', compat='override')
+    else:
+        ds = xr.concat([xr.open_dataset(f) for f in files], dim='valid_time', data_vars='minimal',
+                       coords='minimal', compat='override')
+    if 'valid_time' in ds.dims:
+        ds = ds.rename(valid_time='time')
+    return ds[['u10', 'v10']]
+
+
+#### u10, v10 series (time) of one grid point: the nearest to (lat, lon), or the only point of the files
+def windPoint(ds, lat=None, lon=None):
+    if lat is not None and lon is not None:
+        return ds.sel(latitude=lat, longitude=lon, method='nearest')
+    if ds.sizes.get('latitude', 1) > 1 or ds.sizes.get('longitude', 1) > 1:
+        raise ValueError('the wind files have %d x %d grid points, choose one with lat and lon'
+                         % (ds.sizes['latitude'], ds.sizes['longitude']))
+    return ds.isel(latitude=0, longitude=0) if 'latitude' in ds.dims else ds
+
+
+#### sorted time axis without duplicates (overlapping files), checked for a regular step without gaps
+def checkTime(ds):
+    time = pd.DatetimeIndex(np.asarray(ds.time))
+    if not time.is_monotonic_increasing or time.has_duplicates:
+        ds = ds.sortby('time')
+        ds = ds.isel(time=~pd.DatetimeIndex(np.asarray(ds.time)).duplicated())
+        time = pd.DatetimeIndex(np.asarray(ds.time))
+    if len(time) < 2:
+        return ds, None
+    steps = np.diff(time.asi8)
+    step = np.median(steps)
+    if np.any(steps != step):
+        i = int(np.flatnonzero(steps != step)[0])
+        raise ValueError('irregular time axis of the wind: %s -> %s (step %s)'
+                         % (time[i], time[i + 1], pd.Timedelta(int(step))))
+    return ds, pd.Timedelta(int(step))
+
+
+#### wind direction (deg, as in 3_preprocesamiento_ERA5.ipynb) and speed (m/s) from the components
+def windFromUV(u10, v10):
+    DIR = np.degrees(np.arctan2(u10, v10)) % 360
+    WS = np.sqrt(u10**2 + v10**2)
+    return DIR, WS
+
+
+########################################################################################################################
+#### PREPROCESSING
+########################################################################################################################
+
+#### files: ERA5 files (pattern or list) with u10, v10; outfile: NetCDF-3 file with DIR, WS
+#### dt: model time step (hours); time: model time axis (datetime64), None: regular axis of step dt
+#### how: 'instant' (the wind at the model time steps) or 'mean' (vector mean of u, v over [t, t+dt))
+#### lat, lon: grid point if the files have several
+def prepareWind(files=FILES, outfile=OUTFILE, dt=DT, time=None, how='instant', lat=None, lon=None):
+
+    if how not in ['instant', 'mean']:
+        raise ValueError("how must be 'instant' or 'mean', got %r" % how)
+
+    ds, step = checkTime(windPoint(openWind(files), lat, lon))
+    dt = pd.Timedelta(hours=dt)
+    if step is not None and (dt < step or dt % step != pd.Timedelta(0)):
+        raise ValueError('the model time step %s is not a multiple of the wind time step %s' % (dt, step))
+
+    if how == 'mean' and step is not None and step < dt:
+        ds = ds.resample(time=dt, label='left', closed='left').mean()
+
+    ## model time steps
+    wtime = pd.DatetimeIndex(np.asarray(ds.time))
+    if time is None:
+        time = pd.date_range(wtime[0].ceil(dt), wtime[-1], freq=dt)
+    idx = wtime.get_indexer(pd.DatetimeIndex(np.asarray(time)))
+    if np.any(idx < 0):
+        raise ValueError('%d time steps of the model are not in the wind data, e.g. %s'
+                         % (np.sum(idx < 0), np.asarray(time)[idx < 0][0]))
+
+    u10 = np.asarray(ds.u10[idx])
+    v10 = np.asarray(ds.v10[idx])
+    DIR, WS = windFromUV(u10, v10)
+
+    out = xr.Dataset(
+        data_vars=dict(DIR=(['time'], DIR.astype('f8'), dict(units='deg', long_name='Wind direction')),
+                       WS=(['time'], WS.astype('f8'), dict(units='m/s', long_name='Wind speed'))),
+        coords=dict(time=(['time'], np.asarray(time, dtype='datetime64[ns]'))))
+    out.attrs['dt'] = dt / pd.Timedelta(hours=1)
+    out.attrs['aggregation'] = how
+    out.to_netcdf(outfile, format='NETCDF3_64BIT', encoding=dict(time=dict(units='hours since 1900-01-01', dtype='f8')))
+
+    return outfile
+
+
+########################################################################################################################
+#### COMMAND LINE
+########################################################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Wind direction and speed from ERA5 u10, v10')
+    parser.add_argument('--files', default=FILES, help='ERA5 files (pattern)')
+    parser.add_argument('--out', default=OUTFILE, help='output file')
+    parser.add_argument('--dt', type=float, default=DT, help='model time step (hours)')
+    parser.add_argument('--how', default='instant', choices=['instant', 'mean'], help='values at the model time steps')
+    parser.add_argument('--lat', type=float, default=None, help='latitude of the grid point (several points)')
+    parser.add_argument('--lon', type=float, default=None, help='longitude of the grid point (several points)')
+    args = parser.parse_args()
+
+    prepareWind(args.files, args.out, args.dt, how=args.how, lat=args.lat, lon=args.lon)